@@ -1,17 +1,81 @@
-import requests
-import json
-from typing import List, Dict, Any
+import time
+import atexit
+from collections import deque
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterator, Optional, Tuple
 
 from config.settings import settings
+from utils.chunker import describe_location
+from agents.response_parser import ResponseSectionParser
+from agents.deepseek_client import AsyncDeepSeekClient, BackgroundLoop
+
+# 参与首字延迟统计的最近请求数
+TTFT_WINDOW = 1000
+
+
+class AnalysisStream:
+    """一次流式分析：迭代得到 (段落, 增量文本)，结束后 result 为完整结果"""
+
+    def __init__(self, agent: "DeepSeekAgent", prompt: str, search_results: List[Dict[str, Any]]):
+        self.agent = agent
+        self.prompt = prompt
+        self.search_results = search_results
+        self.parser = ResponseSectionParser()
+        self.result: Optional[Dict[str, Any]] = None
+        # 首字延迟（秒）：从发出请求到收到第一个内容片段
+        self.ttft: Optional[float] = None
+        self.total_time: Optional[float] = None
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        start = time.perf_counter()
+        for delta in self.agent._stream_deepseek_api(self.prompt):
+            yield from self._feed(delta, start)
+        yield from self._finish(start)
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[str, str]]:
+        start = time.perf_counter()
+        async for delta in self.agent._astream_deepseek_api(self.prompt):
+            for event in self._feed(delta, start):
+                yield event
+        for event in self._finish(start):
+            yield event
+
+    def _feed(self, delta: str, start: float) -> List[Tuple[str, str]]:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - start
+            self.agent._record_ttft(self.ttft)
+        return self.parser.feed(delta)
+
+    def _finish(self, start: float) -> List[Tuple[str, str]]:
+        events = self.parser.close()
+        self.total_time = time.perf_counter() - start
+        self.result = {**self.parser.result(), "sources": self.search_results}
+        return events
 
 
 class DeepSeekAgent:
     def __init__(self):
         self.api_key = settings.DEEPSEEK_API_KEY
         self.base_url = settings.DEEPSEEK_BASE_URL
-
-    def analyze_with_citations(self, query: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """基于检索结果进行深度分析并生成引用"""
+        self.stream = settings.DEEPSEEK_STREAM
+        self._ttfts = deque(maxlen=TTFT_WINDOW)
+        # 异步客户端运行在后台事件循环中，同步接口和其他事件循环均通过它发起请求
+        self.client = AsyncDeepSeekClient(self.api_key, self.base_url)
+        self._runner = BackgroundLoop()
+        atexit.register(self.close)
+
+    def analyze_with_citations(self, query: str, search_results: List[Dict[str, Any]],
+                               on_delta: Callable[[str, str], None] = None) -> Dict[str, Any]:
+        """基于检索结果进行深度分析并生成引用
+
+        流式模式下每收到一段文本即调用 on_delta(段落, 增量文本)，段落为 analysis 或 answer。
+        API 调用失败时抛出 DeepSeekAPIError。
+        """
+        if self.stream:
+            stream = self.stream_analysis(query, search_results)
+            for section, delta in stream:
+                if on_delta:
+                    on_delta(section, delta)
+            return stream.result
 
         # 准备上下文
         context = self._prepare_context(search_results)
@@ -25,6 +89,49 @@ class DeepSeekAgent:
         # 解析响应
         return self._parse_response(response, search_results)
 
+    async def analyze_with_citations_async(self, query: str, search_results: List[Dict[str, Any]],
+                                           on_delta: Callable[[str, str], None] = None) -> Dict[str, Any]:
+        """analyze_with_citations 的异步版本，可在任意事件循环中并发调用"""
+        if self.stream:
+            stream = self.stream_analysis(query, search_results)
+            async for section, delta in stream:
+                if on_delta:
+                    on_delta(section, delta)
+            return stream.result
+
+        context = self._prepare_context(search_results)
+        prompt = self._build_analysis_prompt(query, context, search_results)
+        response = await self._runner.submit(self.client.chat(self._request_body(prompt)))
+        return self._parse_response(response, search_results)
+
+    def stream_analysis(self, query: str, search_results: List[Dict[str, Any]]) -> AnalysisStream:
+        """流式分析，返回可迭代的 AnalysisStream"""
+        context = self._prepare_context(search_results)
+        prompt = self._build_analysis_prompt(query, context, search_results)
+        return AnalysisStream(self, prompt, search_results)
+
+    def stats(self) -> Dict[str, Any]:
+        """最近请求的首字延迟统计（秒）、重试次数和熔断状态"""
+        stats = {'retries': self.client.retries, 'circuit': self.client.breaker.state}
+        if not self._ttfts:
+            return {'requests': 0, 'ttft_mean': None, 'ttft_p50': None, 'ttft_p95': None, **stats}
+        ttfts = sorted(self._ttfts)
+        return {
+            'requests': len(ttfts),
+            'ttft_mean': sum(ttfts) / len(ttfts),
+            'ttft_p50': ttfts[len(ttfts) // 2],
+            'ttft_p95': ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.95))],
+            **stats
+        }
+
+    def close(self):
+        """关闭连接池"""
+        if self._runner.running:
+            self._runner.run(self.client.close())
+
+    def _record_ttft(self, ttft: float):
+        self._ttfts.append(ttft)
+
     def _prepare_context(self, search_results: List[Dict[str, Any]]) -> str:
         """准备上下文信息"""
         context_parts = []
@@ -33,7 +140,8 @@ class DeepSeekAgent:
             context_parts.append(f"文档 {i + 1}:\n")
             context_parts.append(f"标题: {doc['title']}\n")
             context_parts.append(f"格式: {doc['format_source']}\n")
-            context_parts.append(f"内容片段: {doc['content'][:500]}...\n")
+            context_parts.append(f"位置: {describe_location(doc)}\n")
+            context_parts.append(f"内容片段: {doc['content']}\n")
             context_parts.append(f"相关度得分: {score:.4f}\n")
             context_parts.append("-" * 50 + "\n")
 
@@ -53,7 +161,7 @@ class DeepSeekAgent:
 
 1. 首先进行思考分析，整合不同文献的观点，进行逻辑推理
 2. 在回答中必须明确标注引用来源，格式为: "来源: [格式]《标题》[具体位置]"
-3. 具体位置可以是段落编号、章节名称、表格/公式编号等
+3. 具体位置使用每个文档片段给出的"位置"（段落编号），也可补充章节名称、表格/公式编号等
 4. 回答要专业、准确，基于文献内容进行解读
 5. 如果文献中有矛盾观点，请进行对比分析
 
@@ -64,14 +172,8 @@ class DeepSeekAgent:
 """
         return prompt
 
-    def _call_deepseek_api(self, prompt: str) -> str:
-        """调用DeepSeek API"""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
-        data = {
+    def _request_body(self, prompt: str) -> Dict[str, Any]:
+        return {
             "model": "deepseek-chat",
             "messages": [
                 {
@@ -83,45 +185,20 @@ class DeepSeekAgent:
             "max_tokens": 2000
         }
 
-        try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
+    def _call_deepseek_api(self, prompt: str) -> str:
+        """调用DeepSeek API，失败时抛出 DeepSeekAPIError"""
+        return self._runner.run(self.client.chat(self._request_body(prompt)))
 
-            result = response.json()
-            return result['choices'][0]['message']['content']
+    def _stream_deepseek_api(self, prompt: str) -> Iterator[str]:
+        """以 SSE 流式调用 DeepSeek API，逐个产出内容增量"""
+        return self._runner.iterate(self.client.stream_chat(self._request_body(prompt)))
 
-        except Exception as e:
-            print(f"DeepSeek API调用失败: {e}")
-            return f"API调用错误: {str(e)}"
+    def _astream_deepseek_api(self, prompt: str) -> AsyncIterator[str]:
+        return self._runner.aiterate(self.client.stream_chat(self._request_body(prompt)))
 
     def _parse_response(self, response: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
         """解析API响应"""
-        # 简单的响应解析，实际应该更复杂
-        lines = response.split('\n')
-        analysis = ""
-        answer = ""
-        current_section = ""
-
-        for line in lines:
-            if line.startswith('思考分析:'):
-                current_section = "analysis"
-                analysis = line.replace('思考分析:', '').strip()
-            elif line.startswith('回答:'):
-                current_section = "answer"
-                answer = line.replace('回答:', '').strip()
-            else:
-                if current_section == "analysis":
-                    analysis += "\n" + line
-                elif current_section == "answer":
-                    answer += "\n" + line
-
-        return {
-            "analysis": analysis.strip(),
-            "answer": answer.strip(),
-            "sources": search_results
-        }
\ No newline at end of file
+        parser = ResponseSectionParser()
+        parser.feed(response)
+        parser.close()
+        return {**parser.result(), "sources": search_results}
\ No newline at end of file
@@ -0,0 +1,266 @@
+import json
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator, Optional
+
+import aiohttp
+
+from config.settings import settings
+from agents.errors import DeepSeekAPIError, CircuitOpenError
+
+# 可重试的HTTP状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断，冷却期过后只放行一个试探请求，成功即恢复
+
+    试探请求未返回结果前其他请求仍被拒绝；试探请求被取消等未记录结果时，
+    超过 reset_timeout 后允许新的试探。
+    """
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or settings.DEEPSEEK_CIRCUIT_FAILURES
+        self.reset_timeout = reset_timeout if reset_timeout is not None else settings.DEEPSEEK_CIRCUIT_RESET
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def check(self) -> bool:
+        """检查是否放行请求，返回 True 表示本次请求为半开状态下的试探请求"""
+        state = self.state
+        if state == 'open':
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            raise CircuitOpenError(f"DeepSeek API 连续失败，熔断中（{remaining:.0f}秒后重试）")
+        if state == 'half_open':
+            now = time.monotonic()
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                raise CircuitOpenError("DeepSeek API 熔断恢复中，等待试探请求结果")
+            self.probe_started = now
+            return True
+        return False
+
+    def release_probe(self):
+        """试探请求未得出可用性结论（如4xx、限流）时，允许下一个试探"""
+        self.probe_started = None
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_started = None
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class AsyncDeepSeekClient:
+    """基于 aiohttp 的 DeepSeek 客户端
+
+    复用长连接会话，信号量限制并发请求数；连接超时与读取超时分开设置；
+    429/5xx 和网络错误按带抖动的指数退避重试，响应带 Retry-After 时按其等待；
+    连续失败触发熔断。流式请求只在收到第一个内容片段之前重试。
+    会话和信号量绑定到首次使用的事件循环。
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None, max_concurrency: int = None,
+                 connect_timeout: float = None, read_timeout: float = None, max_retries: int = None):
+        self.api_key = api_key or settings.DEEPSEEK_API_KEY
+        self.base_url = (base_url or settings.DEEPSEEK_BASE_URL).rstrip('/')
+        self.max_concurrency = max_concurrency or settings.DEEPSEEK_MAX_CONCURRENCY
+        self.timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout or settings.DEEPSEEK_CONNECT_TIMEOUT,
+            sock_read=read_timeout or settings.DEEPSEEK_READ_TIMEOUT
+        )
+        self.max_retries = max_retries if max_retries is not None else settings.DEEPSEEK_MAX_RETRIES
+        self.breaker = CircuitBreaker()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.retries = 0
+
+    async def chat(self, data: Dict[str, Any]) -> str:
+        """非流式请求，返回完整回复内容"""
+        async with self._semaphore_for_loop():
+            response = await self._post({**data, "stream": False})
+            try:
+                result = await response.json(content_type=None)
+                content = result['choices'][0]['message']['content']
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                self.breaker.record_failure()
+                raise DeepSeekAPIError(f"读取响应失败: {e}") from e
+            except (KeyError, IndexError, TypeError) as e:
+                # 状态码正常但响应体为错误信息或格式不符
+                self.breaker.record_failure()
+                raise DeepSeekAPIError(f"响应格式错误: {str(result)[:200]}") from e
+            finally:
+                response.release()
+            self.breaker.record_success()
+            return content
+
+    async def stream_chat(self, data: Dict[str, Any]) -> AsyncIterator[str]:
+        """流式请求（SSE），逐个产出内容增量"""
+        async with self._semaphore_for_loop():
+            response = await self._post({**data, "stream": True})
+            try:
+                async for line in response.content:
+                    line = line.strip()
+                    if not line.startswith(b'data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == b'[DONE]':
+                        break
+                    choices = json.loads(payload.decode('utf-8')).get('choices') or [{}]
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        yield content
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                self.breaker.record_failure()
+                raise DeepSeekAPIError(f"流式响应中断: {e}") from e
+            finally:
+                response.release()
+            self.breaker.record_success()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _semaphore_for_loop(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.api_key}"
+                }
+            )
+        return self._session
+
+    async def _post(self, data: Dict[str, Any]) -> aiohttp.ClientResponse:
+        """发送请求并在可重试的错误上重试，返回状态正常的响应"""
+        url = f"{self.base_url}/chat/completions"
+        attempt = 0
+        while True:
+            probe = self.breaker.check()
+            retry_after = None
+            try:
+                response = await self._get_session().post(url, json=data)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure()
+                error = DeepSeekAPIError(f"请求失败: {e!r}")
+            else:
+                if response.status < 400:
+                    return response
+                body = (await response.text())[:200]
+                response.release()
+                error = DeepSeekAPIError(f"HTTP {response.status}: {body}", status=response.status)
+                if response.status not in RETRY_STATUS:
+                    if probe:
+                        self.breaker.release_probe()
+                    raise error
+                retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+                if response.status != 429:
+                    self.breaker.record_failure()
+                elif probe:
+                    # 限流说明服务可用，不计入熔断
+                    self.breaker.release_probe()
+
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+        """全抖动指数退避；服务端给出 Retry-After 时以其为下限"""
+        delay = random.uniform(0, min(settings.DEEPSEEK_BACKOFF_MAX,
+                                      settings.DEEPSEEK_BACKOFF_BASE * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class BackgroundLoop:
+    """在后台线程运行的事件循环，供同步代码和其他事件循环调用异步客户端"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="deepseek-client", daemon=True).start()
+            return self._loop
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def run(self, coro: Awaitable) -> Any:
+        """同步等待协程结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """同步迭代异步生成器"""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+    async def submit(self, coro: Awaitable) -> Any:
+        """在其他事件循环中等待协程结果"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def aiterate(self, agen: AsyncIterator) -> AsyncIterator:
+        """在其他事件循环中迭代异步生成器"""
+        try:
+            while True:
+                try:
+                    yield await self.submit(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            await self.submit(agen.aclose())
@@ -0,0 +1,10 @@
+class DeepSeekAPIError(Exception):
+    """DeepSeek API 调用失败"""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(DeepSeekAPIError):
+    """熔断器打开期间拒绝请求"""
@@ -0,0 +1,75 @@
+from typing import Dict, List, Tuple
+
+# 段落标记（行首）及对应的结果字段
+SECTION_MARKERS = {
+    '思考分析': 'analysis',
+    '回答': 'answer'
+}
+MARKER_PREFIXES = {f"{name}{colon}": section
+                   for name, section in SECTION_MARKERS.items() for colon in (':', '：')}
+
+
+class ResponseSectionParser:
+    """按行首的“思考分析:”“回答:”标记增量切分模型输出
+
+    feed 接收任意切分的文本片段，返回 (段落, 增量文本) 列表；只有行首可能
+    构成标记的少量字符会暂缓输出，其余文本立即产出。第一个标记之前的内容忽略。
+    """
+
+    def __init__(self):
+        self.current = None
+        self._parts: Dict[str, List[str]] = {section: [] for section in SECTION_MARKERS.values()}
+        # 行首尚未确定是否为段落标记的文本
+        self._pending = ''
+        self._line_start = True
+        # 标记之后的空白不计入正文
+        self._skip_space = False
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        events = []
+        plain = []
+        for char in text:
+            if self._line_start:
+                self._pending += char
+                section = MARKER_PREFIXES.get(self._pending)
+                if section is not None:
+                    self._emit(events, plain)
+                    self.current = section
+                    self._pending = ''
+                    self._line_start = False
+                    self._skip_space = True
+                elif not any(marker.startswith(self._pending) for marker in MARKER_PREFIXES):
+                    plain.append(self._pending)
+                    self._line_start = char == '\n'
+                    self._pending = ''
+                continue
+
+            if self._skip_space:
+                if char.isspace() and char != '\n':
+                    continue
+                self._skip_space = False
+            plain.append(char)
+            if char == '\n':
+                self._line_start = True
+
+        self._emit(events, plain)
+        return events
+
+    def close(self) -> List[Tuple[str, str]]:
+        """输入结束，输出暂存的行首文本"""
+        events = []
+        if self._pending:
+            plain = [self._pending]
+            self._pending = ''
+            self._emit(events, plain)
+        return events
+
+    def result(self) -> Dict[str, str]:
+        return {section: ''.join(parts).strip() for section, parts in self._parts.items()}
+
+    def _emit(self, events: List[Tuple[str, str]], plain: List[str]):
+        if plain and self.current is not None:
+            text = ''.join(plain)
+            self._parts[self.current].append(text)
+            events.append((self.current, text))
+        plain.clear()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+近似最近邻索引基准：各索引类型及查询参数下的 recall@k 与延迟，以精确 flat 索引为基准
+
+用法: python benchmarks/bench_ann.py --num-vectors 200000
+      python benchmarks/bench_ann.py --from-index   # 使用 FAISS_INDEX_PATH 中已有的向量
+"""
+import os
+import sys
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings
+from utils.index_factory import build_index, configure_search
+
+# 每种索引类型要扫描的查询参数
+SEARCH_PARAMS = {
+    'ivf_flat': [('nprobe', n) for n in (1, 4, 16, 64)],
+    'ivf_pq': [('nprobe', n) for n in (1, 4, 16, 64)],
+    'hnsw': [('efSearch', n) for n in (16, 32, 64, 128, 256)],
+}
+
+
+def synthetic_vectors(num_vectors: int, dim: int, num_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """生成带聚类结构的单位向量，近似句向量的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim)).astype('float32')
+    labels = rng.integers(0, num_clusters, num_vectors)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((num_vectors, dim)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def load_index_vectors() -> np.ndarray:
+    """从已保存的索引中取出全部向量"""
+    index = faiss.read_index(os.path.join(settings.FAISS_INDEX_PATH, "faiss.index"))
+    ids = faiss.vector_to_array(index.id_map) if isinstance(index, faiss.IndexIDMap) else None
+    if ids is None:
+        raise ValueError("仅支持从 flat/hnsw 索引导出向量")
+    return index.reconstruct_batch(ids)
+
+
+def index_size_mb(index: faiss.Index) -> float:
+    return faiss.serialize_index(index).nbytes / (1024 * 1024)
+
+
+def run_queries(index: faiss.Index, queries: np.ndarray, k: int):
+    """逐条查询以测量单次查询延迟，返回 (结果ID, 平均毫秒)"""
+    results = np.empty((len(queries), k), dtype='int64')
+    start = time.perf_counter()
+    for i in range(len(queries)):
+        _, ids = index.search(queries[i:i + 1], k)
+        results[i] = ids[0]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def recall_at_k(results: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(r.tolist()) & set(t.tolist())) for r, t in zip(results, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似最近邻索引 recall/延迟基准")
+    parser.add_argument("--num-vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=['ivf_flat', 'ivf_pq', 'hnsw'])
+    parser.add_argument("--from-index", action="store_true", help="使用已有索引中的向量")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    vectors = load_index_vectors() if args.from_index else synthetic_vectors(args.num_vectors, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype('float32')
+    faiss.normalize_L2(queries)
+    ids = np.arange(len(vectors), dtype='int64')
+
+    flat = build_index('flat', vectors.shape[1])
+    flat.add_with_ids(vectors, ids)
+    truth, flat_ms = run_queries(flat, queries, args.top_k)
+
+    print(f"向量数 {len(vectors)}，维度 {vectors.shape[1]}，recall@{args.top_k}")
+    print(f"{'索引':<10} {'参数':<14} {'recall':>8} {'延迟(ms)':>10} {'构建(s)':>9} {'大小(MB)':>9}")
+    print(f"{'flat':<10} {'-':<14} {1.0:>8.3f} {flat_ms:>10.3f} {0.0:>9.1f} {index_size_mb(flat):>9.1f}")
+
+    for index_type in args.types:
+        start = time.perf_counter()
+        index = build_index(index_type, vectors.shape[1], vectors)
+        index.add_with_ids(vectors, ids)
+        build_s = time.perf_counter() - start
+        size_mb = index_size_mb(index)
+
+        for name, value in SEARCH_PARAMS[index_type]:
+            if name == 'nprobe':
+                configure_search(index, nprobe=value)
+            else:
+                configure_search(index, ef_search=value)
+            results, ms = run_queries(index, queries, args.top_k)
+            print(f"{index_type:<10} {f'{name}={value}':<14} {recall_at_k(results, truth):>8.3f} "
+                  f"{ms:>10.3f} {build_s:>9.1f} {size_mb:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
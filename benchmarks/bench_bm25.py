@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+BM25检索延迟基准：稠密 get_scores + argsort 与倒排稀疏 top_k 对比
+
+用法: python benchmarks/bench_bm25.py --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.bm25_index import BM25Index
+
+
+def build_synthetic_index(num_docs: int, vocab_size: int, avg_len: int, seed: int = 0) -> BM25Index:
+    """生成词频服从Zipf分布的合成语料并直接构建倒排表"""
+    rng = np.random.default_rng(seed)
+    doc_lens = rng.poisson(avg_len, num_docs).astype('int32')
+    total = int(doc_lens.sum())
+
+    # Zipf 词项分布，截断到词表范围
+    post_terms = (rng.zipf(1.1, total) - 1) % vocab_size
+    post_slots = np.repeat(np.arange(num_docs, dtype='int64'), doc_lens)
+
+    # 合并同一文档内的重复词项得到词频
+    keys = post_slots * vocab_size + post_terms
+    keys, tfs = np.unique(keys, return_counts=True)
+
+    index = BM25Index()
+    index.terms = [f"t{i}" for i in range(vocab_size)]
+    index.vocab = {term: tid for tid, term in enumerate(index.terms)}
+    index.doc_ids = np.arange(num_docs, dtype='int64')
+    index.doc_lens = doc_lens
+    # 基准直接写入倒排数组，跳过逐文档分词
+    index._set_postings(keys % vocab_size, keys // vocab_size, tfs)
+    return index
+
+
+def sample_queries(index: BM25Index, num_queries: int, seed: int = 1):
+    """混合高频词和中低频词构造查询"""
+    rng = np.random.default_rng(seed)
+    vocab_size = len(index.terms)
+    queries = []
+    for _ in range(num_queries):
+        common = rng.integers(0, 50, 1)
+        rare = rng.integers(50, vocab_size, 3)
+        queries.append([index.terms[t] for t in np.concatenate([common, rare])])
+    return queries
+
+
+def time_queries(fn, queries) -> float:
+    """返回每个查询的平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25检索延迟基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--vocab", type=int, default=200000)
+    parser.add_argument("--avg-len", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'片段数':>10} {'倒排记录':>12} {'稠密(ms)':>10} {'稀疏(ms)':>10} {'加速比':>8}")
+    for size in args.sizes:
+        index = build_synthetic_index(size, args.vocab, args.avg_len)
+        queries = sample_queries(index, args.queries)
+        k = args.top_k
+
+        def dense(query):
+            scores = index.get_scores(query)
+            return np.argsort(scores)[::-1][:k]
+
+        def sparse(query):
+            return index.top_k(query, k)
+
+        # 两种方式结果应一致
+        for query in queries[:5]:
+            expected = set(np.argsort(index.get_scores(query))[::-1][:k].tolist())
+            got = set(index.top_k(query, k)[0].tolist())
+            assert len(expected & got) >= k - 1, "稀疏检索结果与稠密检索不一致"
+
+        dense_ms = time_queries(dense, queries)
+        sparse_ms = time_queries(sparse, queries)
+        print(f"{size:>10} {len(index.post_slots):>12} {dense_ms:>10.2f} {sparse_ms:>10.2f} "
+              f"{dense_ms / sparse_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
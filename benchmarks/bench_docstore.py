@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+文档存储基准：列式内存映射存储与旧版 pickle 的加载耗时、加载后常驻内存和按ID读取延迟
+
+用法: python benchmarks/bench_docstore.py --sizes 10000 100000 500000
+（常驻内存读取 /proc/self/statm，仅支持 Linux）
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.document_store import DocumentStore
+
+# 在子进程中加载，避免构建数据占用的内存影响测量
+LOAD_SCRIPT = """
+import os, sys, time, pickle
+import numpy as np
+sys.path.append({project!r})
+from utils.document_store import DocumentStore
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+base = rss_mb()
+start = time.perf_counter()
+if {fmt!r} == 'pickle':
+    with open({path!r}, 'rb') as f:
+        data = pickle.load(f)
+    get = lambda chunk_id: data['chunks'][chunk_id]
+else:
+    store = DocumentStore.load({path!r})
+    get = store.get
+load_ms = (time.perf_counter() - start) * 1000
+loaded = rss_mb()
+
+rng = np.random.default_rng(0)
+ids = rng.integers(0, {size}, 1000).tolist()
+start = time.perf_counter()
+for chunk_id in ids:
+    get(chunk_id)['content']
+get_us = (time.perf_counter() - start) / len(ids) * 1e6
+print(load_ms, loaded - base, get_us)
+"""
+
+
+def synthetic_chunks(size: int, chunk_chars: int, chunks_per_doc: int = 20):
+    """生成片段与文档元数据，结构与 TextChunker 输出一致"""
+    text = "深度学习模型在医学影像诊断中的准确率达到了较高水平，实验数据见下表。" * (chunk_chars // 34 + 1)
+    documents = {}
+    chunks = []
+    for chunk_id in range(size):
+        path = f"data/raw/doc{chunk_id // chunks_per_doc}.pdf"
+        if path not in documents:
+            documents[path] = {"title": os.path.basename(path), "format_source": "PDF", "file_path": path,
+                               "structured_info": {}, "paragraph_count": chunks_per_doc,
+                               "chunk_count": chunks_per_doc}
+        chunks.append({
+            "title": documents[path]['title'], "format_source": "PDF", "file_path": path,
+            "content": f"{chunk_id} {text[:chunk_chars]}", "chunk_index": chunk_id % chunks_per_doc,
+            "paragraph_start": chunk_id % chunks_per_doc, "paragraph_end": chunk_id % chunks_per_doc,
+            "char_start": 0, "char_end": chunk_chars, "chunk_id": chunk_id,
+            "content_hash": f"{chunk_id:040x}"
+        })
+    return documents, chunks
+
+
+def measure(fmt: str, path: str, size: int):
+    script = LOAD_SCRIPT.format(project=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                fmt=fmt, path=path, size=size)
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return [float(value) for value in output.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文档存储基准")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument("--chunk-chars", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'片段数':>10} {'格式':>8} {'文件MB':>8} {'加载ms':>10} {'加载后内存MB':>14} {'读取us':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in args.sizes:
+            documents, chunks = synthetic_chunks(size, args.chunk_chars)
+
+            pickle_path = os.path.join(tmp_dir, f"documents_{size}.pkl")
+            with open(pickle_path, 'wb') as f:
+                pickle.dump({'chunks': chunks, 'chunk_ids': list(range(size)), 'documents': documents}, f)
+
+            store_dir = os.path.join(tmp_dir, f"docstore_{size}")
+            store = DocumentStore()
+            by_path = {}
+            for chunk in chunks:
+                by_path.setdefault(chunk['file_path'], []).append(chunk)
+            for path, doc_meta in documents.items():
+                store.add_document(doc_meta, by_path[path])
+            store.save(store_dir)
+            del store, chunks, by_path
+
+            store_mb = sum(os.path.getsize(os.path.join(store_dir, name))
+                           for name in os.listdir(store_dir)) / (1024 * 1024)
+            for fmt, path, file_mb in (('pickle', pickle_path, os.path.getsize(pickle_path) / (1024 * 1024)),
+                                       ('docstore', store_dir, store_mb)):
+                load_ms, rss_mb, get_us = measure(fmt, path, size)
+                print(f"{size:>10} {fmt:>8} {file_mb:>8.1f} {load_ms:>10.1f} {rss_mb:>14.1f} {get_us:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
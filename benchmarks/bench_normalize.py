@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+文本规范化基准：单遍规范化（_split_blocks）与旧版"清理 → 分段 → 打标签"的吞吐（MB/s）和段落数
+
+用法: python benchmarks/bench_normalize.py --input-dir data/raw --min-mb 20
+（语料取输入目录中的 PDF 文字层和 TXT/MD/TEX 文本，重复到不少于 --min-mb 后计时）
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.document_processor import DocumentProcessor
+
+
+def legacy_normalize(content: str):
+    """旧版流程：压缩全部空白（含换行）后按空行分段，逐段匹配未预编译的正则"""
+    content = re.sub(r'\s+', ' ', content)
+    content = re.sub(r'第\s*\d+\s*页', '', content).strip()
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', content) if p.strip()]
+    tagged = []
+    for para in paragraphs:
+        if re.search(r'\|\s*.+\s*\|', para) or re.search(r'\+[-]+\+', para):
+            tagged.append(f"【表格】{para}")
+        elif re.search(r'\$[^$]+\$|\\\(.*\\\)|\\\[.*\\\]', para):
+            tagged.append(f"【公式】{para}")
+        else:
+            tagged.append(para)
+    return tagged
+
+
+def load_corpus(input_dir: str):
+    """读取样例语料，每个 PDF 页面或文本文件为一段输入"""
+    texts = []
+    for filename in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, filename)
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == '.pdf':
+            import PyPDF2
+            with open(path, 'rb') as f:
+                texts.extend(page.extract_text() or "" for page in PyPDF2.PdfReader(f).pages)
+        elif ext in ('.txt', '.md', '.tex'):
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                texts.append(f.read())
+    return [text for text in texts if text.strip()]
+
+
+def measure(name: str, normalize, texts, total_mb: float):
+    start = time.perf_counter()
+    paragraphs = 0
+    for text in texts:
+        paragraphs += len(normalize(text))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>10} {elapsed:>8.2f} {total_mb / elapsed:>10.1f} {paragraphs:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本规范化基准")
+    parser.add_argument("--input-dir", type=str, default="data/raw")
+    parser.add_argument("--min-mb", type=float, default=20.0)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.input_dir)
+    if not texts:
+        print(f"{args.input_dir} 中没有可用的 PDF/TXT/MD/TEX 语料")
+        return
+    sample_bytes = sum(len(text.encode('utf-8')) for text in texts)
+    repeats = max(1, int(args.min_mb * 1024 * 1024 // sample_bytes) + 1)
+    texts = texts * repeats
+    total_mb = sample_bytes * repeats / (1024 * 1024)
+    print(f"语料: {len(texts) // repeats} 段输入，{sample_bytes / 1024:.1f} KB，重复 {repeats} 次，共 {total_mb:.1f} MB")
+
+    processor = DocumentProcessor(use_cache=False)
+    print(f"{'流程':>10} {'耗时s':>8} {'MB/s':>10} {'段落数':>10}")
+    measure("旧版", legacy_normalize, texts, total_mb)
+    measure("单遍", processor._split_blocks, texts, total_mb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准：导入 main 的耗时分布、--help 耗时，以及可选的缓存命中提问耗时
+
+用法: python benchmarks/bench_startup.py
+      python benchmarks/bench_startup.py --question "机器学习在医疗领域有哪些应用？"
+      （第一次运行会调用 DeepSeek 生成并缓存回答，之后的运行测量缓存命中）
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动阶段应避免导入的重量级模块
+HEAVY_MODULES = ('torch', 'sentence_transformers', 'faiss', 'aiohttp', 'PyPDF2', 'docx', 'openpyxl', 'PIL')
+
+# 在子进程中运行 main 并报告已导入的重量级模块
+RUN_MAIN = """
+import sys
+sys.argv = ['main.py'] + sys.argv[1:]
+import main
+main.main()
+print('HEAVY_MODULES=' + ','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def timed_run(args, repeat: int):
+    """多次运行子进程，返回耗时列表和最后一次的输出"""
+    timings = []
+    output = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable] + args, cwd=PROJECT_DIR,
+                                capture_output=True, text=True)
+        timings.append(time.perf_counter() - start)
+        output = result.stdout + result.stderr
+    return timings, output
+
+
+def import_profile(top: int):
+    """用 -X importtime 统计导入 main 时累计耗时最多的模块"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=PROJECT_DIR, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.split('|')
+        rows.append((int(cumulative.strip()), module.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def report(name: str, timings):
+    print(f"{name:<24} 最小 {min(timings) * 1000:8.1f} ms   中位数 {statistics.median(timings) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="显示导入耗时最多的模块数")
+    parser.add_argument("--question", type=str, help="测量该问题命中缓存时的端到端耗时")
+    args = parser.parse_args()
+
+    print("导入 main 累计耗时最多的模块:")
+    for cumulative, module in import_profile(args.top):
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+    print()
+
+    timings, _ = timed_run(['-c', 'import main'], args.repeat)
+    report("import main", timings)
+    timings, _ = timed_run(['main.py', '--help'], args.repeat)
+    report("main.py --help", timings)
+
+    if args.question:
+        script = RUN_MAIN.format(heavy=HEAVY_MODULES)
+        # 预热：确保回答已写入缓存
+        timed_run(['-c', script, '--question', args.question], 1)
+        timings, output = timed_run(['-c', script, '--question', args.question], args.repeat)
+        report("缓存命中提问", timings)
+        heavy = [line.split('=', 1)[1] for line in output.splitlines() if line.startswith('HEAVY_MODULES=')]
+        if "=== 缓存回答 ===" not in output:
+            print("  警告: 未命中缓存（缓存未启用或索引已更新）")
+        print(f"  已导入的重量级模块: {heavy[-1] if heavy and heavy[-1] else '无'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+表格解析基准：不同行数的 XLSX 的解析耗时、峰值内存和表格块数量
+
+用法: python benchmarks/bench_tables.py --rows 10000 100000 300000
+（每次解析在独立子进程中进行，峰值内存取自 ru_maxrss，仅支持 Linux/macOS）
+"""
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PARSE_SCRIPT = """
+import sys, time, resource
+sys.path.append({project!r})
+from utils.document_processor import DocumentProcessor
+
+processor = DocumentProcessor(use_cache=False)
+start = time.perf_counter()
+doc = processor.process_document({path!r})
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, len(doc['paragraphs']),
+      len(doc['content']))
+"""
+
+
+def write_workbook(path: str, rows: int):
+    """以只写模式生成样例数据表，生成过程本身不占用与行数成正比的内存"""
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("实验数据")
+    sheet.append(["样本编号", "温度", "浓度", "吸光度", "备注"])
+    for i in range(rows):
+        sheet.append([f"S{i:06d}", 20 + i % 15, round(i * 0.001, 3), round((i % 97) / 97, 4),
+                      "复测" if i % 7 == 0 else None])
+    workbook.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="表格解析基准")
+    parser.add_argument("--rows", type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    project = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'行数':>10} {'文件MB':>8} {'耗时s':>8} {'峰值内存MB':>12} {'表格块':>8} {'文本字符':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in args.rows:
+            path = os.path.join(tmp_dir, f"table_{rows}.xlsx")
+            write_workbook(path, rows)
+            output = subprocess.run([sys.executable, '-c', PARSE_SCRIPT.format(project=project, path=path)],
+                                    capture_output=True, text=True, check=True).stdout
+            elapsed, peak_mb, blocks, chars = output.split()[-4:]
+            print(f"{rows:>10} {os.path.getsize(path) / (1024 * 1024):>8.1f} {float(elapsed):>8.2f} "
+                  f"{float(peak_mb):>12.1f} {blocks:>8} {chars:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,27 @@ class Settings:
     # API配置
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
     DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+    # 是否以流式（SSE）方式调用DeepSeek，边生成边显示
+    DEEPSEEK_STREAM = os.getenv("DEEPSEEK_STREAM", "true").lower() == "true"
+    # 同时进行的API请求数上限（连接池大小）
+    DEEPSEEK_MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "8"))
+    DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv("DEEPSEEK_CONNECT_TIMEOUT", "10"))
+    # 读取超时：两次收到数据之间的最长等待时间
+    DEEPSEEK_READ_TIMEOUT = float(os.getenv("DEEPSEEK_READ_TIMEOUT", "60"))
+    DEEPSEEK_MAX_RETRIES = int(os.getenv("DEEPSEEK_MAX_RETRIES", "3"))
+    DEEPSEEK_BACKOFF_BASE = float(os.getenv("DEEPSEEK_BACKOFF_BASE", "0.5"))
+    DEEPSEEK_BACKOFF_MAX = float(os.getenv("DEEPSEEK_BACKOFF_MAX", "20"))
+    # 连续失败多少次后熔断，以及熔断持续秒数
+    DEEPSEEK_CIRCUIT_FAILURES = int(os.getenv("DEEPSEEK_CIRCUIT_FAILURES", "5"))
+    DEEPSEEK_CIRCUIT_RESET = float(os.getenv("DEEPSEEK_CIRCUIT_RESET", "30"))
+
+    # 批量问答：同时进行的分析请求数，以及每批合并检索的问题数
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    BATCH_SEARCH_SIZE = int(os.getenv("BATCH_SEARCH_SIZE", "64"))
+
+    # 问答服务监听地址
+    SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+    SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
 
     # 模型路径
     LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "./models/all-MiniLM-L6-v2")
@@ -17,8 +38,72 @@ class Settings:
     PROCESSED_DATA_PATH = os.getenv("PROCESSED_DATA_PATH", "./data/processed")
     RAW_DATA_PATH = "./data/raw"
 
+    # 文档解析配置
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+    # 单个文件的解析超时（秒），不大于 0 表示不限时
+    INGEST_FILE_TIMEOUT = float(os.getenv("INGEST_FILE_TIMEOUT", "600"))
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "32"))
+
+    # OCR配置：进程数（0 表示自动，按 CPU 核数 / 同时解析文件的进程数分配）、
+    # 栅格化分辨率、识别语言、每次栅格化的页数（限制内存占用）
+    OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+    OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+    OCR_LANG = os.getenv("OCR_LANG", "chi_sim+eng")
+    OCR_PAGE_BATCH = int(os.getenv("OCR_PAGE_BATCH", "4"))
+    # 文字层少于该字符数的页面视为扫描页
+    OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "20"))
+    OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(PROCESSED_DATA_PATH, "ocr_cache"))
+
+    # 解析结果缓存（按文件内容哈希），入库结束时清理已删除文件的条目
+    PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE_ENABLED", "true").lower() == "true"
+    PARSE_CACHE_PATH = os.getenv("PARSE_CACHE_PATH", os.path.join(PROCESSED_DATA_PATH, "parse_cache"))
+
+    # 片段切分配置（按字符计；all-MiniLM-L6-v2 最多编码256个词元，中文约一字一词元）
+    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "300"))
+    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "60"))
+    # XLSX/DOCX 表格按块切分，每块的最大行数（同时不超过 CHUNK_SIZE 字符）
+    TABLE_BLOCK_ROWS = int(os.getenv("TABLE_BLOCK_ROWS", "50"))
+
+    # BM25分词器: ngram2（中文字二元组，默认）、jieba（需安装jieba）、whitespace
+    BM25_TOKENIZER = os.getenv("BM25_TOKENIZER", "ngram2")
+
+    # 向量索引配置: auto（按规模自动选择）、flat、ivf_flat、ivf_pq、hnsw
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+    FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))  # 0 表示按规模自动计算
+    FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))
+    FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+    FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+    FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+    FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+    # 筛选后不超过该数量的片段直接精确计算相似度，否则在索引内按ID筛选检索
+    FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "20000"))
+    # 按ID筛选检索时 nprobe / efSearch 的最大放大倍数
+    FILTER_MAX_EFFORT = float(os.getenv("FILTER_MAX_EFFORT", "8"))
+
+    # 混合检索融合配置: rrf（倒数排名融合，默认）、minmax、zscore
+    FUSION_METHOD = os.getenv("FUSION_METHOD", "rrf")
+    BM25_WEIGHT = float(os.getenv("BM25_WEIGHT", "0.3"))
+    VECTOR_WEIGHT = float(os.getenv("VECTOR_WEIGHT", "0.7"))
+    RRF_K = int(os.getenv("RRF_K", "60"))
+    # 每一路检索召回的候选数（至少为 top_k 的两倍）
+    FUSION_CANDIDATES = int(os.getenv("FUSION_CANDIDATES", "20"))
+
     # 缓存配置
     CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_EXPIRY_HOURS = float(os.getenv("CACHE_EXPIRY_HOURS", "24"))
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+    CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    # 回答缓存淘汰策略: lru 或 lfu
+    CACHE_EVICTION_POLICY = os.getenv("CACHE_EVICTION_POLICY", "lru").lower()
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    # 片段向量库的存储精度（float16 或 float32）
+    EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float16")
+    # 查询向量缓存淘汰项是否写入磁盘
+    QUERY_EMBEDDING_SPILL = os.getenv("QUERY_EMBEDDING_SPILL", "false").lower() == "true"
+    # 语义缓存：相似问题在检索到的来源相同时复用已有回答
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_CANDIDATES = int(os.getenv("SEMANTIC_CACHE_CANDIDATES", "5"))
 
     # 支持的文档格式
     SUPPORTED_EXTENSIONS = {
@@ -1,31 +1,98 @@
 import os
 import sys
 import argparse
+import threading
 from typing import List, Dict, Any
 
 # 添加项目路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from utils.document_processor import DocumentProcessor
-from utils.vector_store import VectorStore
+# 文档解析库、向量模型（torch）、FAISS 和 aiohttp 导入较慢，在首次使用时才导入
 from utils.cache_manager import CacheManager
-from agents.deepseek_agent import DeepSeekAgent
+from utils.chunker import describe_location
+from utils.index_meta import read_index_meta
+from utils.ingest_manifest import IngestManifest, file_sha256
+from utils.ingest_pipeline import ParallelIngestor, IngestProgress
+from utils.batch_qa import BatchQuestionRunner
+from utils.parse_cache import ParseCache, remove_unreferenced
+from utils.search_filter import normalize_filter, parse_year_range
+from agents.errors import DeepSeekAPIError
 from config.settings import settings
 
 
+SECTION_TITLES = {
+    'analysis': "=== 思考分析 ===",
+    'answer': "=== 最终回答 ==="
+}
+
+
 class LiteratureQAAssistant:
-    def __init__(self):
-        self.processor = DocumentProcessor()
-        self.vector_store = VectorStore()
-        self.cache_manager = CacheManager()
-        self.deepseek_agent = DeepSeekAgent()
+    """文献问答助手
 
-        # 尝试加载现有索引
-        if not self.vector_store.load_index():
-            print("未找到现有索引，需要先处理文档")
+    除回答缓存外各组件均在首次使用时加载：命中回答缓存的问题无需加载模型和索引。
+    """
 
-    def process_documents(self, input_dir: str = None):
-        """处理文档并创建索引"""
+    def __init__(self):
+        self.cache_manager = CacheManager()
+        self._processor = None
+        self._vector_store = None
+        self._semantic_cache = None
+        self._deepseek_agent = None
+        self._lock = threading.RLock()
+
+    @property
+    def processor(self):
+        with self._lock:
+            if self._processor is None:
+                from utils.document_processor import DocumentProcessor
+                self._processor = DocumentProcessor()
+            return self._processor
+
+    @property
+    def vector_store(self):
+        with self._lock:
+            if self._vector_store is None:
+                from utils.vector_store import VectorStore
+                store = VectorStore()
+                # 尝试加载现有索引
+                if not store.load_index():
+                    print("未找到现有索引，需要先处理文档")
+                self._vector_store = store
+            return self._vector_store
+
+    @property
+    def semantic_cache(self):
+        with self._lock:
+            if self._semantic_cache is None:
+                from utils.semantic_cache import SemanticQuestionCache
+                self._semantic_cache = SemanticQuestionCache(self.cache_manager, self.vector_store.model_id)
+            return self._semantic_cache
+
+    @property
+    def deepseek_agent(self):
+        with self._lock:
+            if self._deepseek_agent is None:
+                from agents.deepseek_agent import DeepSeekAgent
+                self._deepseek_agent = DeepSeekAgent()
+            return self._deepseek_agent
+
+    @property
+    def index_epoch(self) -> str:
+        """当前索引版本；索引尚未加载时读取索引元数据，不加载索引本身"""
+        if self._vector_store is None:
+            meta = read_index_meta()
+            if meta is not None:
+                return meta['index_epoch']
+            if not os.path.exists(os.path.join(settings.FAISS_INDEX_PATH, "documents.pkl")):
+                return ''
+        return self.vector_store.index_epoch
+
+    def process_documents(self, input_dir: str = None, incremental: bool = False, workers: int = None):
+        """处理文档并创建索引
+
+        incremental 为 True 时只解析新增或变更的文件，并移除已删除文件的向量；
+        workers 指定并行解析的进程数，默认取 settings.INGEST_WORKERS。
+        """
         if input_dir is None:
             input_dir = settings.RAW_DATA_PATH
 
@@ -34,40 +101,121 @@ class LiteratureQAAssistant:
             return
 
         # 收集所有支持的文档
-        documents = []
-        for filename in os.listdir(input_dir):
-            file_path = os.path.join(input_dir, filename)
+        file_paths = []
+        for filename in sorted(os.listdir(input_dir)):
             file_ext = os.path.splitext(filename)[1].lower()
-
             if file_ext in settings.SUPPORTED_EXTENSIONS:
-                try:
-                    print(f"处理文档: {filename}")
-                    processed_doc = self.processor.process_document(file_path)
-                    documents.append(processed_doc)
-
-                    # 保存处理后的JSON
-                    output_file = os.path.join(
-                        settings.PROCESSED_DATA_PATH,
-                        f"{os.path.splitext(filename)[0]}.json"
-                    )
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        json.dump(processed_doc, f, ensure_ascii=False, indent=2)
-
-                except Exception as e:
-                    print(f"处理文档 {filename} 时出错: {e}")
-
-        if documents:
-            print(f"开始创建索引，共 {len(documents)} 个文档")
-            self.vector_store.create_index(documents)
-            print("索引创建完成")
+                file_paths.append(os.path.join(input_dir, filename))
+
+        manifest = IngestManifest()
+        update_mode = incremental and self.vector_store.index is not None
+        if update_mode:
+            manifest.load()
+            added, changed, removed, unchanged = manifest.diff(file_paths)
+            print(f"增量索引: 新增 {len(added)}，变更 {len(changed)}，"
+                  f"删除 {len(removed)}，未变 {len(unchanged)}")
+
+            # 变更和删除的文件先移除旧向量；清单缺失时新增文件也可能已在索引中
+            stale = changed + removed + added
+            stale_chunk_ids = self.vector_store.get_chunk_ids(stale)
+            removed_count = self.vector_store.remove_documents(stale, save=False)
+            for file_path in removed:
+                manifest.remove(file_path)
+            to_process = added + changed
+        else:
+            if incremental:
+                print("未找到现有索引，执行全量索引")
+            manifest.clear()
+            removed_count = 0
+            stale_chunk_ids = []
+            to_process = file_paths
+
+        indexed_count = self._ingest_files(to_process, manifest, rebuild=not update_mode, workers=workers)
+
+        if update_mode:
+            if indexed_count or removed_count:
+                print(f"更新索引: 追加 {indexed_count} 个文档，移除 {removed_count} 个文档")
+                self.vector_store.save()
+                invalidated = self.cache_manager.invalidate_chunks(stale_chunk_ids)
+                if invalidated:
+                    print(f"失效 {invalidated} 条引用了旧片段的缓存回答")
+            else:
+                print("索引已是最新")
+            manifest.save()
+        elif indexed_count:
+            self.vector_store.save()
+            manifest.save()
+            # 全量重建后片段ID全部更新，旧版本索引生成的缓存回答一并清除
+            self.cache_manager.invalidate_epoch(self.vector_store.index_epoch)
+            removed_vectors = self.vector_store.compact_embeddings()
+            if removed_vectors:
+                print(f"向量库清理 {removed_vectors} 条过期向量")
+            print(f"索引创建完成，共 {indexed_count} 个文档")
         else:
             print("未找到可处理的文档")
 
-    def ask_question(self, question: str, content_filter: str = None, use_cache: bool = True):
+        self._collect_cache_garbage(file_paths, manifest)
+
+    def _collect_cache_garbage(self, file_paths: List[str], manifest: IngestManifest):
+        """删除已不在输入目录中的文件的解析缓存和OCR缓存，以及旧版本解析器的缓存"""
+        from utils.document_processor import DocumentProcessor
+
+        live_hashes = set()
+        for file_path in file_paths:
+            entry = manifest.entries.get(file_path)
+            try:
+                # 解析失败的文件不在清单中，保留其缓存（如已完成的OCR页面）供重试
+                live_hashes.add(entry['sha256'] if entry else file_sha256(file_path))
+            except OSError:
+                pass
+        live_keys = {DocumentProcessor.cache_key(os.path.splitext(path)[1].lower()) for path in file_paths}
+
+        removed = ParseCache().gc(live_hashes, live_keys)
+        removed += remove_unreferenced(settings.OCR_CACHE_PATH, live_hashes)
+        if removed:
+            print(f"清理 {removed} 项过期的解析缓存和OCR缓存")
+
+    def _ingest_files(self, file_paths: List[str], manifest: IngestManifest,
+                      rebuild: bool, workers: int = None) -> int:
+        """并行解析文件，按完成顺序分批写入索引，返回入库文档数"""
+        if not file_paths:
+            return 0
+
+        ingestor = ParallelIngestor(workers=workers)
+        progress = IngestProgress(len(file_paths))
+        batch = []
+        indexed_count = 0
+
+        for result in ingestor.iter_documents(file_paths):
+            progress.update(result)
+            if result.error:
+                continue
+
+            manifest.update(result.file_path, result.file_state)
+            batch.append(result.document)
+
+            if len(batch) >= settings.INGEST_BATCH_SIZE:
+                indexed_count += self._index_batch(batch, reset=rebuild and indexed_count == 0)
+                batch = []
+
+        if batch:
+            indexed_count += self._index_batch(batch, reset=rebuild and indexed_count == 0)
+
+        progress.summary()
+        return indexed_count
+
+    def _index_batch(self, documents: List[Dict[str, Any]], reset: bool) -> int:
+        """将一批解析结果写入索引，全量重建时在第一批之前清空旧索引"""
+        if reset:
+            self.vector_store.reset()
+        self.vector_store.add_documents(documents, save=False)
+        return len(documents)
+
+    def ask_question(self, question: str, content_filter: Any = None, use_cache: bool = True):
         """回答问题"""
         # 检查缓存
         if use_cache:
-            cached_result = self.cache_manager.get_cached_result(question, {"filter": content_filter})
+            cached_result = self.lookup_cached_answer(question, content_filter)
             if cached_result:
                 print("=== 缓存回答 ===")
                 self._display_result(cached_result)
@@ -83,29 +231,113 @@ class LiteratureQAAssistant:
             print("未找到相关文献")
             return None
 
+        # 语义缓存：相似问题且检索到的来源相同时复用已有回答
+        if use_cache:
+            cached_result = self.lookup_similar_answer(question, search_results, content_filter)
+            if cached_result:
+                print("=== 缓存回答（相似问题） ===")
+                self._display_result(cached_result)
+                return cached_result
+
         # 使用DeepSeek进行分析
         print("进行深度分析...")
-        result = self.deepseek_agent.analyze_with_citations(question, search_results)
+        streamed_sections = []
+
+        def print_delta(section: str, text: str):
+            # 流式模式下边生成边显示
+            if section not in streamed_sections:
+                streamed_sections.append(section)
+                print(f"\n{SECTION_TITLES[section]}")
+            print(text, end='', flush=True)
+
+        try:
+            result = self.deepseek_agent.analyze_with_citations(question, search_results, on_delta=print_delta)
+        except DeepSeekAPIError as e:
+            # 调用失败不缓存，避免把错误信息当作回答
+            print(f"\nDeepSeek API调用失败: {e}")
+            return None
 
         # 缓存结果
         if use_cache:
-            self.cache_manager.set_cached_result(question, result, {"filter": content_filter})
+            self.store_answer(question, result, content_filter)
 
         # 显示结果
-        self._display_result(result)
+        if streamed_sections:
+            print()
+            self._display_sources(result)
+        else:
+            self._display_result(result)
         return result
 
+    def lookup_cached_answer(self, question: str, content_filter: Any = None):
+        """按问题原文查找缓存回答"""
+        return self.cache_manager.get_cached_result(
+            question, {"filter": normalize_filter(content_filter)}, epoch=self.index_epoch
+        )
+
+    def lookup_similar_answer(self, question: str, search_results: List, content_filter: Any = None):
+        """语义缓存：相似问题且检索到的来源相同时复用已有回答"""
+        cached_result = self.semantic_cache.lookup(
+            self.vector_store.encode_query(question), {"filter": normalize_filter(content_filter)},
+            self.vector_store.index_epoch, [chunk_id for chunk_id, _, _ in search_results]
+        )
+        if cached_result:
+            # 以本次问题原文再存一份，下次无需检索即可命中
+            self._cache_result(question, cached_result, content_filter)
+        return cached_result
+
+    def store_answer(self, question: str, result: Dict[str, Any], content_filter: Any = None):
+        """缓存新生成的回答并登记问题向量"""
+        self._cache_result(question, result, content_filter)
+        self.semantic_cache.add(question, {"filter": normalize_filter(content_filter)}, self.vector_store.encode_query(question))
+
+    def reload_index(self) -> bool:
+        """重新加载磁盘上的索引，成功后整体替换当前索引，失败时保留原索引
+
+        替换只是一次属性赋值，正在进行的检索继续使用旧索引直至完成。
+        """
+        from utils.vector_store import VectorStore
+        store = VectorStore(model=self.vector_store.model)
+        # 查询向量与索引内容无关，沿用已有缓存
+        store.query_cache = self.vector_store.query_cache
+        # 只读加载，索引目录的写入只由入库流程进行
+        if not store.load_index(persist=False):
+            return False
+        self._vector_store = store
+        return True
+
+    def batch_questions(self, input_path: str, output_path: str = None,
+                        content_filter: Any = None, concurrency: int = None):
+        """批量回答JSONL问题集，结果逐条追加写入JSONL，可断点续跑"""
+        if not os.path.exists(input_path):
+            print(f"问题文件不存在: {input_path}")
+            return None
+        runner = BatchQuestionRunner(self, concurrency=concurrency)
+        return runner.run(input_path, output_path, default_filter=content_filter)
+
+    def _cache_result(self, question: str, result: Dict[str, Any], content_filter: Any = None):
+        """按问题原文缓存回答，记录索引版本和引用的片段"""
+        self.cache_manager.set_cached_result(
+            question, result, {"filter": normalize_filter(content_filter)},
+            epoch=self.vector_store.index_epoch,
+            chunk_ids=[chunk_id for chunk_id, _, _ in result.get('sources', [])]
+        )
+
     def _display_result(self, result: Dict[str, Any]):
         """显示结果"""
-        print("\n=== 思考分析 ===")
+        print(f"\n{SECTION_TITLES['analysis']}")
         print(result.get('analysis', '无分析内容'))
 
-        print("\n=== 最终回答 ===")
+        print(f"\n{SECTION_TITLES['answer']}")
         print(result.get('answer', '无回答内容'))
 
+        self._display_sources(result)
+
+    def _display_sources(self, result: Dict[str, Any]):
+        """显示引用来源"""
         print("\n=== 引用来源 ===")
         for i, (idx, score, doc) in enumerate(result.get('sources', [])):
-            print(f"{i + 1}. {doc['format_source']}《{doc['title']}》 (相关度: {score:.4f})")
+            print(f"{i + 1}. {doc['format_source']}《{doc['title']}》{describe_location(doc)} (相关度: {score:.4f})")
 
     def interactive_mode(self):
         """交互式模式"""
@@ -140,21 +372,45 @@ class LiteratureQAAssistant:
                 print(f"发生错误: {e}")
 
 
+def cli_filter(args) -> Any:
+    """合并命令行筛选参数；只有内容标签时保持原来的字符串形式"""
+    if not (args.format_source or args.year or args.author):
+        return args.filter
+    return {'tag': args.filter, 'format_source': args.format_source, 'year': args.year, 'author': args.author}
+
+
 def main():
     parser = argparse.ArgumentParser(description="文献文档智能问答助手")
     parser.add_argument("--process", action="store_true", help="处理文档并创建索引")
+    parser.add_argument("--incremental", action="store_true", help="增量处理：仅索引新增或变更的文档")
+    parser.add_argument("--workers", type=int, help="并行解析文档的进程数")
     parser.add_argument("--question", type=str, help="直接提问")
     parser.add_argument("--filter", type=str, choices=['表格', '公式'], help="内容筛选")
+    parser.add_argument("--format-source", type=str, nargs='+', help="只检索指定格式的文献，如 PDF DOCX")
+    parser.add_argument("--year", type=parse_year_range, help="按参考文献年份筛选，如 2020 或 2018-2022")
+    parser.add_argument("--author", type=str, help="按参考文献作者筛选（包含匹配）")
     parser.add_argument("--interactive", action="store_true", help="交互式模式")
+    parser.add_argument("--batch", type=str, help="批量问答：JSONL问题文件（每行含 question 或 title/body 字段）")
+    parser.add_argument("--output", type=str, help="批量问答结果文件，默认为 <问题文件名>.answers.jsonl")
+    parser.add_argument("--concurrency", type=int, help="批量问答时同时进行的DeepSeek请求数")
+    parser.add_argument("--serve", action="store_true", help="启动常驻HTTP问答服务")
+    parser.add_argument("--host", type=str, help="服务监听地址")
+    parser.add_argument("--port", type=int, help="服务监听端口")
 
     args = parser.parse_args()
+    content_filter = cli_filter(args)
 
     assistant = LiteratureQAAssistant()
 
     if args.process:
-        assistant.process_documents()
+        assistant.process_documents(incremental=args.incremental, workers=args.workers)
+    elif args.serve:
+        from server import QAServer
+        QAServer(assistant).run(args.host, args.port)
+    elif args.batch:
+        assistant.batch_questions(args.batch, args.output, content_filter, args.concurrency)
     elif args.question:
-        assistant.ask_question(args.question, args.filter)
+        assistant.ask_question(args.question, content_filter)
     else:
         assistant.interactive_mode()
 
@@ -0,0 +1,236 @@
+import json
+import time
+import asyncio
+import functools
+from collections import defaultdict
+from typing import Any, Dict
+
+from aiohttp import web
+
+from config.settings import settings
+from utils.batch_qa import serialize_answer, serialize_sources
+from utils.search_filter import normalize_filter
+from agents.errors import DeepSeekAPIError
+
+# 响应中的中文不转义
+json_response = functools.partial(web.json_response, dumps=functools.partial(json.dumps, ensure_ascii=False))
+
+
+class RequestMetrics:
+    """按接口统计请求数、错误数和耗时"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.latency = defaultdict(float)
+        self.in_flight = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'uptime': time.time() - self.started_at,
+            'in_flight': self.in_flight,
+            'endpoints': {
+                path: {
+                    'requests': count,
+                    'errors': self.errors[path],
+                    'mean_latency': self.latency[path] / count
+                } for path, count in self.requests.items()
+            }
+        }
+
+
+class QAServer:
+    """常驻HTTP服务：模型和索引只加载一次，供多个请求共享
+
+    启动时在线程池中加载索引和嵌入模型，加载完成后才开始接受请求；检索在线程池
+    中执行，不阻塞事件循环；/reload 在后台加载新索引，加载成功后整体替换，期间
+    请求继续使用旧索引。
+    """
+
+    def __init__(self, assistant):
+        self.assistant = assistant
+        self.metrics = RequestMetrics()
+        self.loaded_at = time.time()
+        self._reload_lock = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._metrics_middleware])
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/metrics', self.metrics_handler)
+        app.router.add_post('/search', self.search)
+        app.router.add_post('/ask', self.ask)
+        app.router.add_post('/reload', self.reload)
+        app.on_startup.append(self._warm_up)
+        return app
+
+    def run(self, host: str = None, port: int = None):
+        host = host or settings.SERVER_HOST
+        port = port or settings.SERVER_PORT
+        print("正在加载索引和模型...")
+        # 预热完成、开始监听后再输出地址
+        web.run_app(self.create_app(), host=host, port=port,
+                    print=lambda _: print(f"问答服务已启动: http://{host}:{port}"))
+
+    async def _warm_up(self, app: web.Application):
+        """加载索引（FAISS、片段存储、BM25）和嵌入模型，避免首个请求在事件循环中同步加载"""
+        store = await self._run_blocking(getattr, self.assistant, 'vector_store')
+        await self._run_blocking(getattr, store, 'model')
+        self.loaded_at = time.time()
+        print("索引和模型加载完成")
+
+    @web.middleware
+    async def _metrics_middleware(self, request: web.Request, handler):
+        start = time.perf_counter()
+        self.metrics.in_flight += 1
+        try:
+            response = await handler(request)
+            if response.status >= 400:
+                self.metrics.errors[request.path] += 1
+            return response
+        except Exception:
+            self.metrics.errors[request.path] += 1
+            raise
+        finally:
+            self.metrics.in_flight -= 1
+            self.metrics.requests[request.path] += 1
+            self.metrics.latency[request.path] += time.perf_counter() - start
+
+    async def health(self, request: web.Request) -> web.Response:
+        store = self.assistant.vector_store
+        return json_response({
+            'status': 'ok' if store.index is not None else 'no_index',
+            'chunks': len(store.chunk_ids),
+            'documents': len(store.documents),
+            'index_epoch': store.index_epoch,
+            'loaded_at': self.loaded_at
+        })
+
+    async def metrics_handler(self, request: web.Request) -> web.Response:
+        store = self.assistant.vector_store
+        return json_response({
+            'server': self.metrics.snapshot(),
+            'answer_cache': self.assistant.cache_manager.stats(),
+            'semantic_cache': self.assistant.semantic_cache.stats(),
+            'query_embedding_cache': store.query_cache.stats(),
+            'deepseek': self.assistant.deepseek_agent.stats()
+        })
+
+    async def search(self, request: web.Request) -> web.Response:
+        params = await self._parse_query(request)
+        store = self.assistant.vector_store
+        results = await self._run_blocking(store.hybrid_search, params['question'],
+                                           params['top_k'], params['filter'])
+        return json_response({'results': self._serialize_results(results)})
+
+    async def ask(self, request: web.Request) -> web.StreamResponse:
+        params = await self._parse_query(request)
+        question, content_filter = params['question'], params['filter']
+
+        if params['use_cache']:
+            cached = await self._run_blocking(self.assistant.lookup_cached_answer, question, content_filter)
+            if cached:
+                return await self._respond(request, params, cached, cached=True)
+
+        search_results = await self._run_blocking(self.assistant.vector_store.hybrid_search,
+                                                  question, params['top_k'], content_filter)
+        if not search_results:
+            raise web.HTTPNotFound(text="未找到相关文献")
+
+        if params['use_cache']:
+            cached = await self._run_blocking(self.assistant.lookup_similar_answer,
+                                              question, search_results, content_filter)
+            if cached:
+                return await self._respond(request, params, cached, cached=True)
+
+        if not params['stream']:
+            try:
+                result = await self.assistant.deepseek_agent.analyze_with_citations_async(question, search_results)
+            except DeepSeekAPIError as e:
+                raise web.HTTPBadGateway(text=f"DeepSeek API调用失败: {e}")
+            if params['use_cache']:
+                await self._run_blocking(self.assistant.store_answer, question, result, content_filter)
+            return await self._respond(request, params, result, cached=False)
+
+        # 流式输出：SSE 事件 analysis/answer 为增量文本，done 为完整结果
+        response = await self._start_sse(request)
+        stream = self.assistant.deepseek_agent.stream_analysis(question, search_results)
+        try:
+            async for section, delta in stream:
+                await self._send_event(response, section, {'text': delta})
+        except DeepSeekAPIError as e:
+            await self._send_event(response, 'error', {'error': f"DeepSeek API调用失败: {e}"})
+            return response
+
+        if params['use_cache']:
+            await self._run_blocking(self.assistant.store_answer, question, stream.result, content_filter)
+        await self._send_event(response, 'done', serialize_answer(stream.result, cached=False))
+        return response
+
+    async def reload(self, request: web.Request) -> web.Response:
+        """加载磁盘上的最新索引（入库完成后调用）"""
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            if not await self._run_blocking(self.assistant.reload_index):
+                raise web.HTTPInternalServerError(text="索引加载失败，继续使用原索引")
+            self.loaded_at = time.time()
+        return await self.health(request)
+
+    async def _respond(self, request: web.Request, params: Dict[str, Any],
+                       result: Dict[str, Any], cached: bool) -> web.StreamResponse:
+        payload = serialize_answer(result, cached)
+        if not params['stream']:
+            return json_response(payload)
+        response = await self._start_sse(request)
+        for section in ('analysis', 'answer'):
+            await self._send_event(response, section, {'text': payload[section]})
+        await self._send_event(response, 'done', payload)
+        return response
+
+    @staticmethod
+    async def _parse_query(request: web.Request) -> Dict[str, Any]:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="请求体必须为JSON")
+        question = str(body.get('question') or '').strip()
+        if not question:
+            raise web.HTTPBadRequest(text="缺少 question")
+        try:
+            content_filter = normalize_filter(body.get('filter'))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=f"filter 不合法: {e}")
+        try:
+            top_k = min(max(int(body.get('top_k', 5)), 1), 50)
+        except (TypeError, ValueError):
+            raise web.HTTPBadRequest(text="top_k 必须为整数")
+        return {
+            'question': question,
+            'filter': content_filter,
+            'top_k': top_k,
+            'stream': bool(body.get('stream', False)),
+            'use_cache': bool(body.get('use_cache', True))
+        }
+
+    @staticmethod
+    async def _run_blocking(func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+    @staticmethod
+    async def _start_sse(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream; charset=utf-8',
+            'Cache-Control': 'no-cache'
+        })
+        await response.prepare(request)
+        return response
+
+    @staticmethod
+    async def _send_event(response: web.StreamResponse, event: str, data: Dict[str, Any]):
+        await response.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+    @staticmethod
+    def _serialize_results(results) -> list:
+        return [{**source, 'content': chunk['content']}
+                for source, (_, _, chunk) in zip(serialize_sources(results), results)]
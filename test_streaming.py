@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+流式输出测试：段落标记解析器在任意切分下的结果，以及 stream_chat 对本地模拟 SSE 服务的解析
+
+用法: python test_streaming.py（也可用 pytest 运行）
+"""
+import os
+import sys
+import json
+import asyncio
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agents.response_parser import ResponseSectionParser
+
+RESPONSE = "前言会被忽略\n思考分析: 文献A给出了实验数据。\n回答说明不是标记\n回答：\n  最终结论见文献A。\n"
+EXPECTED = {'analysis': "文献A给出了实验数据。\n回答说明不是标记", 'answer': "最终结论见文献A。"}
+
+
+def parse_chunks(chunks):
+    parser = ResponseSectionParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.close())
+    return parser.result(), events
+
+
+def test_parser_marker_split_chunks():
+    """标记被切分到多个片段时（逐字、在冒号前后、在换行处断开）结果一致"""
+    splits = [
+        [RESPONSE],
+        list(RESPONSE),
+        ["前言会被忽略\n思考", "分析", ": 文献A给出了实验数据。\n回", "答说明不是标记\n回答", "：\n  ", "最终结论见文献A。\n"],
+        ["前言会被忽略\n思考分析:", " ", "文献A给出了实验数据。\n", "回答说明不是标记\n", "回答：", "\n  最终", "结论见文献A。\n"],
+    ]
+    for chunks in splits:
+        result, events = parse_chunks(chunks)
+        assert result == EXPECTED, (chunks, result)
+        # 增量事件拼接后与最终结果一致，且标记本身不会出现在正文中
+        streamed = {'analysis': '', 'answer': ''}
+        for section, text in events:
+            streamed[section] += text
+        assert {section: text.strip() for section, text in streamed.items()} == EXPECTED, (chunks, events)
+
+
+def test_parser_pending_prefix_flushed_on_close():
+    """结尾处像标记前缀的行首文本在 close 时输出"""
+    result, _ = parse_chunks(["回答: 结论\n", "思考"])
+    assert result['answer'] == "结论\n思考"
+
+
+async def _run_stream_chat(chunks):
+    from aiohttp import web
+    from agents.deepseek_client import AsyncDeepSeekClient
+
+    async def completions(request):
+        body = await request.json()
+        assert body['stream'] is True
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await response.write(b": keep-alive\n\n")
+        for chunk in chunks:
+            event = {'choices': [{'delta': {'content': chunk}}]}
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+        await response.write(b'data: {"choices": [{"delta": {}}]}\n\n')
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    client = AsyncDeepSeekClient(api_key="test", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0)
+    try:
+        received = []
+        async for delta in client.stream_chat({"model": "deepseek-chat", "messages": []}):
+            received.append(delta)
+        return received, client.breaker.state
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def test_stream_chat_against_mock_server():
+    """stream_chat 逐个产出 SSE 内容增量，忽略注释行、空增量和 [DONE]"""
+    chunks = ["思考", "分析: 文献A", "给出了数据。\n回答", "：结论"]
+    received, breaker_state = asyncio.run(_run_stream_chat(chunks))
+    assert received == chunks
+    assert breaker_state == 'closed'
+
+    result, _ = parse_chunks(received)
+    assert result == {'analysis': "文献A给出了数据。", 'answer': "结论"}
+
+
+if __name__ == "__main__":
+    test_parser_marker_split_chunks()
+    test_parser_pending_prefix_flushed_on_close()
+    test_stream_chat_against_mock_server()
+    print("流式输出测试通过！")
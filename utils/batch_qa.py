@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import asyncio
+import functools
+from typing import Any, Dict, List, Set
+
+from config.settings import settings
+from utils.chunker import describe_location
+from utils.search_filter import filter_key, normalize_filter
+
+
+def load_questions(input_path: str, default_filter: str = None) -> List[Dict[str, Any]]:
+    """读取JSONL问题集，每行取 question 字段，没有时用 title 和 body 拼接"""
+    records = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            question = item.get('question') or "\n".join(
+                part for part in (item.get('title'), item.get('body')) if part
+            )
+            records.append({
+                'id': str(item.get('id') or item.get('request_id') or f"line-{line_no}"),
+                'question': question.strip(),
+                'filter': item.get('filter', default_filter)
+            })
+    return records
+
+
+def load_completed(output_path: str) -> Set[str]:
+    """已成功回答的问题ID，用于断点续跑；中断时写了一半的行忽略"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'error' not in record:
+                completed.add(record['id'])
+    return completed
+
+
+def serialize_sources(sources: List) -> List[Dict[str, Any]]:
+    return [{
+        'chunk_id': int(chunk_id),
+        'score': float(score),
+        'title': chunk['title'],
+        'format_source': chunk['format_source'],
+        'file_path': chunk['file_path'],
+        'location': describe_location(chunk)
+    } for chunk_id, score, chunk in sources]
+
+
+def serialize_answer(result: Dict[str, Any], cached: bool) -> Dict[str, Any]:
+    return {
+        'analysis': result.get('analysis', ''),
+        'answer': result.get('answer', ''),
+        'sources': serialize_sources(result.get('sources', [])),
+        'cached': cached
+    }
+
+
+class BatchQuestionRunner:
+    """批量问答
+
+    按批检索（查询向量一次编码、FAISS 对整个查询矩阵一次检索），命中缓存的问题
+    直接输出，其余问题并发调用 DeepSeek，并发数受 concurrency 限制。每个问题
+    完成后立即追加写入输出文件，重新运行时跳过已成功回答的问题。
+    """
+
+    def __init__(self, assistant, concurrency: int = None, search_batch_size: int = None):
+        self.assistant = assistant
+        self.concurrency = concurrency or settings.BATCH_CONCURRENCY
+        self.search_batch_size = search_batch_size or settings.BATCH_SEARCH_SIZE
+
+    def run(self, input_path: str, output_path: str = None, default_filter: str = None) -> Dict[str, int]:
+        if output_path is None:
+            output_path = f"{os.path.splitext(input_path)[0]}.answers.jsonl"
+
+        records = load_questions(input_path, default_filter)
+        completed = load_completed(output_path)
+        pending = [record for record in records if record['id'] not in completed]
+        print(f"批量问答: 共 {len(records)} 个问题，已完成 {len(records) - len(pending)}，待处理 {len(pending)}")
+        print(f"结果写入: {output_path}")
+
+        summary = asyncio.run(self._run(pending, output_path))
+        print(f"批量问答完成: 成功 {summary['answered']}（缓存 {summary['cached']}），失败 {summary['failed']}")
+        return summary
+
+    async def _run(self, records: List[Dict[str, Any]], output_path: str) -> Dict[str, int]:
+        summary = {'answered': 0, 'cached': 0, 'failed': 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        tasks = set()
+        # 同一批次中重复的问题共用一次API调用
+        analyses: Dict[tuple, asyncio.Future] = {}
+
+        # 上次中断时最后一行可能不完整，另起一行继续写
+        needs_newline = False
+        if os.path.exists(output_path) and os.path.getsize(output_path):
+            with open(output_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+
+        with open(output_path, 'a', encoding='utf-8') as output:
+            if needs_newline:
+                output.write('\n')
+
+            def write(record: Dict[str, Any], payload: Dict[str, Any], started: float):
+                key = 'failed' if 'error' in payload else 'answered'
+                summary[key] += 1
+                summary['cached'] += int(payload.get('cached', False))
+                payload = {'id': record['id'], 'question': record['question'], **payload,
+                           'elapsed': round(time.perf_counter() - started, 3)}
+                output.write(json.dumps(payload, ensure_ascii=False) + "\n")
+                output.flush()
+                status = payload.get('error') or ("缓存" if payload.get('cached') else "完成")
+                print(f"[{sum(summary[k] for k in ('answered', 'failed'))}/{len(records)}] {record['id']}: {status}")
+
+            async def analyze(question: str, search_results: List) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self.assistant.deepseek_agent.analyze_with_citations_async(question, search_results)
+
+            async def answer(record: Dict[str, Any], analysis: asyncio.Future, started: float):
+                try:
+                    result = await analysis
+                except Exception as e:
+                    # 失败的问题写入错误信息，重新运行时会再次尝试
+                    write(record, {'error': f"分析失败: {e}"}, started)
+                    return
+                # 写缓存（SQLite）和问题编码在线程池中进行，不阻塞事件循环
+                await loop.run_in_executor(None, self.assistant.store_answer,
+                                           record['question'], result, record['filter'])
+                write(record, serialize_answer(result, cached=False), started)
+
+            for start in range(0, len(records), self.search_batch_size):
+                batch = records[start:start + self.search_batch_size]
+                started = time.perf_counter()
+
+                to_search = []
+                for record in batch:
+                    if not record['question']:
+                        write(record, {'error': "问题为空"}, started)
+                        continue
+                    try:
+                        record['filter'] = normalize_filter(record['filter'])
+                    except ValueError as e:
+                        write(record, {'error': f"筛选条件不合法: {e}"}, started)
+                        continue
+                    cached = await loop.run_in_executor(None, self.assistant.lookup_cached_answer,
+                                                        record['question'], record['filter'])
+                    if cached:
+                        write(record, serialize_answer(cached, cached=True), started)
+                    else:
+                        to_search.append(record)
+
+                # 同一筛选条件的问题合并检索；检索在线程池中进行，不阻塞已发出的API请求
+                by_filter: Dict[str, List[Dict[str, Any]]] = {}
+                for record in to_search:
+                    by_filter.setdefault(filter_key(record['filter']), []).append(record)
+                for group in by_filter.values():
+                    # vector_store 首次访问时加载索引，也放在线程池中
+                    all_results = await loop.run_in_executor(None, functools.partial(
+                        self._search, [record['question'] for record in group], group[0]['filter']
+                    ))
+                    for record, search_results in zip(group, all_results):
+                        if not search_results:
+                            write(record, {'error': "未找到相关文献"}, started)
+                            continue
+                        cached = await loop.run_in_executor(
+                            None, self.assistant.lookup_similar_answer,
+                            record['question'], search_results, record['filter']
+                        )
+                        if cached:
+                            write(record, serialize_answer(cached, cached=True), started)
+                            continue
+                        key = (record['question'], filter_key(record['filter']))
+                        if key not in analyses:
+                            analyses[key] = asyncio.ensure_future(analyze(record['question'], search_results))
+                        tasks.add(asyncio.ensure_future(answer(record, analyses[key], started)))
+
+                # 限制排队中的API任务数，避免一次检索完全部问题占用内存
+                while len(tasks) >= 2 * self.concurrency:
+                    done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+            if tasks:
+                await asyncio.wait(tasks)
+        return summary
+
+    def _search(self, questions: List[str], content_filter: Any) -> List[List]:
+        return self.assistant.vector_store.batch_hybrid_search(questions, 5, content_filter)
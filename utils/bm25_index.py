@@ -0,0 +1,251 @@
+import os
+import json
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+# 磁盘格式版本，结构变化时递增
+FORMAT_VERSION = 2
+
+
+class BM25Index:
+    """可持久化、可增量更新的BM25倒排索引
+
+    倒排表以CSR形式存放：indptr[t]:indptr[t+1] 为词项 t 的倒排区间，
+    post_slots 为文档槽位，post_tfs 为词频，post_weights 为预先算好的
+    单项BM25得分。槽位按插入顺序分配，doc_ids 记录槽位对应的外部ID（片段ID）。
+    所有数组以 .npy 保存，加载时内存映射，无需重新分词或统计。
+
+    查询只读取查询词的倒排区间，打分仅涉及包含查询词的文档。
+
+    IDF 采用 log(1 + (N - df + 0.5) / (df + 0.5))，恒为正，增量更新时无需
+    像 BM25Okapi 那样对负值做平滑。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, tokenizer: str = ""):
+        self.k1 = k1
+        self.b = b
+        # 构建倒排表所用分词器，查询必须使用同一分词器
+        self.tokenizer = tokenizer
+        self.terms: List[str] = []
+        self.vocab = {}
+        self.indptr = np.zeros(1, dtype='int64')
+        self.post_slots = np.zeros(0, dtype='int32')
+        self.post_tfs = np.zeros(0, dtype='int32')
+        self.post_weights = np.zeros(0, dtype='float32')
+        self.doc_ids = np.zeros(0, dtype='int64')
+        self.doc_lens = np.zeros(0, dtype='int32')
+        self.idf = np.zeros(0, dtype='float32')
+        self.avgdl = 0.0
+        # 新增文档先暂存，读取或保存前统一合并进倒排表
+        self._pending = []
+
+    def __len__(self) -> int:
+        return len(self.doc_ids) + len(self._pending)
+
+    def add_documents(self, doc_ids: Iterable[int], tokenized_texts: Iterable[List[str]]):
+        """追加已分词的文档"""
+        for doc_id, tokens in zip(doc_ids, tokenized_texts):
+            self._pending.append((int(doc_id), Counter(tokens), len(tokens)))
+
+    def remove_documents(self, doc_ids: Iterable[int]) -> int:
+        """删除文档并压缩倒排表，返回删除数量"""
+        self._flush()
+        remove_mask = np.isin(self.doc_ids, np.fromiter(doc_ids, dtype='int64'))
+        removed = int(remove_mask.sum())
+        if not removed:
+            return 0
+
+        keep_slots = ~remove_mask
+        slot_map = np.cumsum(keep_slots) - 1
+        keep_postings = keep_slots[self.post_slots]
+
+        terms = self._posting_terms()[keep_postings]
+        slots = slot_map[self.post_slots[keep_postings]]
+        tfs = self.post_tfs[keep_postings]
+
+        # 去掉不再出现的词项
+        df = np.bincount(terms, minlength=len(self.terms))
+        keep_terms = df > 0
+        term_map = np.cumsum(keep_terms) - 1
+        self.terms = [term for term, keep in zip(self.terms, keep_terms) if keep]
+        self.vocab = {term: tid for tid, term in enumerate(self.terms)}
+
+        self.doc_ids = np.asarray(self.doc_ids[keep_slots])
+        self.doc_lens = np.asarray(self.doc_lens[keep_slots])
+        self._set_postings(term_map[terms], slots, tfs)
+        return removed
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """计算查询对所有槽位的BM25得分（稠密数组）"""
+        scores = np.zeros(len(self), dtype='float32')
+        slots, weights = self._gather(query_tokens)
+        np.add.at(scores, slots, weights)
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int,
+              slot_mask: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """返回得分最高的 k 个槽位及得分，只访问查询词的倒排区间
+
+        slot_mask 为按槽位的布尔掩码（见 slot_mask()），只在掩码为真的文档中取 top-k。
+        """
+        slots, weights = self._gather(query_tokens)
+        if slot_mask is not None and len(slots):
+            keep = slot_mask[slots]
+            slots, weights = slots[keep], weights[keep]
+        if not len(slots):
+            return np.zeros(0, dtype='int64'), np.zeros(0, dtype='float32')
+
+        # 同一文档的多条倒排记录累加
+        hit_slots, inverse = np.unique(slots, return_inverse=True)
+        hit_scores = np.bincount(inverse, weights=weights).astype('float32')
+
+        if len(hit_slots) > k:
+            top = np.argpartition(-hit_scores, k - 1)[:k]
+        else:
+            top = np.arange(len(hit_slots))
+        top = top[np.argsort(-hit_scores[top], kind='stable')]
+        return hit_slots[top].astype('int64'), hit_scores[top]
+
+    def slot_mask(self, doc_ids: np.ndarray) -> np.ndarray:
+        """外部ID集合对应的槽位掩码，供 top_k 筛选"""
+        self._flush()
+        return np.isin(self.doc_ids, doc_ids)
+
+    def _gather(self, query_tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """拼接查询词的倒排记录，重复的查询词按次数加权"""
+        self._flush()
+        slot_parts, weight_parts = [], []
+        for token, count in Counter(query_tokens).items():
+            tid = self.vocab.get(token)
+            if tid is None:
+                continue
+            start, end = self.indptr[tid], self.indptr[tid + 1]
+            slot_parts.append(self.post_slots[start:end])
+            weights = self.post_weights[start:end]
+            weight_parts.append(weights * count if count > 1 else weights)
+
+        if not slot_parts:
+            return np.zeros(0, dtype='int32'), np.zeros(0, dtype='float32')
+        return np.concatenate(slot_parts), np.concatenate(weight_parts)
+
+    def save(self, index_dir: str):
+        """将倒排表和统计量写入目录"""
+        self._flush()
+        os.makedirs(index_dir, exist_ok=True)
+
+        arrays = {
+            'indptr': self.indptr,
+            'post_slots': self.post_slots,
+            'post_tfs': self.post_tfs,
+            'post_weights': self.post_weights,
+            'doc_ids': self.doc_ids,
+            'doc_lens': self.doc_lens,
+            'idf': self.idf
+        }
+        # 先转为内存数组，避免覆盖仍被映射的文件
+        for name, array in arrays.items():
+            setattr(self, name, np.array(array))
+        for name in arrays:
+            self._atomic_write(os.path.join(index_dir, f"{name}.npy"),
+                               lambda f, array=getattr(self, name): np.save(f, array))
+
+        self._atomic_write(os.path.join(index_dir, "vocab.json"),
+                           lambda f: f.write(json.dumps(self.terms, ensure_ascii=False).encode('utf-8')))
+
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'k1': self.k1,
+            'b': self.b,
+            'tokenizer': self.tokenizer,
+            'avgdl': self.avgdl,
+            'doc_count': len(self.doc_ids),
+            'term_count': len(self.terms)
+        }
+        self._atomic_write(os.path.join(index_dir, "meta.json"),
+                           lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+    @classmethod
+    def load(cls, index_dir: str, tokenizer: str = None) -> "BM25Index":
+        """从目录加载，数组以只读内存映射方式打开
+
+        指定 tokenizer 时校验其与构建时的分词器一致。
+        """
+        with open(os.path.join(index_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"BM25索引格式版本不匹配: {meta.get('format_version')}")
+        if tokenizer is not None and meta.get('tokenizer') != tokenizer:
+            raise ValueError(f"BM25索引分词器为 {meta.get('tokenizer')}，当前配置为 {tokenizer}")
+
+        index = cls(k1=meta['k1'], b=meta['b'], tokenizer=meta['tokenizer'])
+        with open(os.path.join(index_dir, "vocab.json"), 'r', encoding='utf-8') as f:
+            index.terms = json.load(f)
+        index.vocab = {term: tid for tid, term in enumerate(index.terms)}
+
+        for name in ('indptr', 'post_slots', 'post_tfs', 'post_weights', 'doc_ids', 'doc_lens', 'idf'):
+            setattr(index, name, np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r'))
+        index.avgdl = meta['avgdl']
+
+        if len(index.doc_ids) != meta['doc_count'] or len(index.indptr) != len(index.terms) + 1:
+            raise ValueError("BM25索引文件不完整")
+        return index
+
+    def _flush(self):
+        """将暂存文档合并进倒排表"""
+        if not self._pending:
+            return
+
+        first_slot = len(self.doc_ids)
+        new_terms, new_slots, new_tfs = [], [], []
+        for offset, (_, counts, _) in enumerate(self._pending):
+            for term, tf in counts.items():
+                tid = self.vocab.get(term)
+                if tid is None:
+                    tid = len(self.terms)
+                    self.vocab[term] = tid
+                    self.terms.append(term)
+                new_terms.append(tid)
+                new_slots.append(first_slot + offset)
+                new_tfs.append(tf)
+
+        terms = np.concatenate([self._posting_terms(), np.array(new_terms, dtype='int64')])
+        slots = np.concatenate([self.post_slots, np.array(new_slots, dtype='int32')])
+        tfs = np.concatenate([self.post_tfs, np.array(new_tfs, dtype='int32')])
+
+        self.doc_ids = np.concatenate([self.doc_ids, np.array([p[0] for p in self._pending], dtype='int64')])
+        self.doc_lens = np.concatenate([self.doc_lens, np.array([p[2] for p in self._pending], dtype='int32')])
+        self._pending = []
+        self._set_postings(terms, slots, tfs)
+
+    def _posting_terms(self) -> np.ndarray:
+        """展开每条倒排记录所属的词项ID"""
+        return np.repeat(np.arange(len(self.indptr) - 1, dtype='int64'), np.diff(self.indptr))
+
+    def _set_postings(self, terms: np.ndarray, slots: np.ndarray, tfs: np.ndarray):
+        """按 (词项, 槽位) 排序重建CSR倒排表并更新统计量"""
+        order = np.lexsort((slots, terms))
+        self.post_slots = slots[order].astype('int32')
+        self.post_tfs = tfs[order].astype('int32')
+
+        df = np.bincount(terms, minlength=len(self.terms))
+        self.indptr = np.zeros(len(self.terms) + 1, dtype='int64')
+        np.cumsum(df, out=self.indptr[1:])
+
+        doc_count = len(self.doc_ids)
+        self.avgdl = float(self.doc_lens.mean()) if doc_count else 0.0
+        self.idf = np.log1p((doc_count - df + 0.5) / (df + 0.5)).astype('float32')
+
+        # 预计算每条倒排记录的得分，查询时只需按槽位累加
+        tfs = self.post_tfs.astype('float32')
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens[self.post_slots] / (self.avgdl or 1.0))
+        post_idf = np.repeat(self.idf, np.diff(self.indptr))
+        self.post_weights = (post_idf * tfs * (self.k1 + 1) / (tfs + norm)).astype('float32')
+
+    @staticmethod
+    def _atomic_write(path: str, write):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
@@ -1,84 +1,299 @@
 import os
 import json
+import time
+import sqlite3
 import hashlib
-import pickle
-from typing import Any, Dict, Optional
-from datetime import datetime, timedelta
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
 
 from config.settings import settings
 
+# 表结构版本，记录在 PRAGMA user_version 中，不一致时重建缓存表
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    filters TEXT NOT NULL,
+    epoch TEXT NOT NULL,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_answers_expires ON answers(expires_at);
+CREATE INDEX IF NOT EXISTS idx_answers_lru ON answers(accessed_at);
+CREATE INDEX IF NOT EXISTS idx_answers_lfu ON answers(hits, accessed_at);
+CREATE INDEX IF NOT EXISTS idx_answers_epoch ON answers(epoch);
+
+-- 回答引用的片段ID，片段变更或删除时据此精确失效
+CREATE TABLE IF NOT EXISTS answer_chunks (
+    chunk_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (chunk_id, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_answer_chunks_key ON answer_chunks(key);
+
+-- 问题向量，供语义缓存在启动时重建向量索引
+CREATE TABLE IF NOT EXISTS question_embeddings (
+    key TEXT PRIMARY KEY,
+    model_id TEXT NOT NULL,
+    embedding BLOB NOT NULL
+);
+
+-- 条目数和总字节数由触发器维护，容量检查无需扫描全表
+CREATE TABLE IF NOT EXISTS cache_usage (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_usage (id, entries, bytes) VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS answers_insert AFTER INSERT ON answers BEGIN
+    UPDATE cache_usage SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS answers_delete AFTER DELETE ON answers BEGIN
+    UPDATE cache_usage SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 1;
+    DELETE FROM answer_chunks WHERE key = OLD.key;
+    DELETE FROM question_embeddings WHERE key = OLD.key;
+END;
+"""
+
+DROP_SCHEMA = """
+DROP TRIGGER IF EXISTS answers_insert;
+DROP TRIGGER IF EXISTS answers_delete;
+DROP TABLE IF EXISTS answer_chunks;
+DROP TABLE IF EXISTS question_embeddings;
+DROP TABLE IF EXISTS answers;
+DROP TABLE IF EXISTS cache_usage;
+"""
+
+# 单条 SQL 语句的参数数量上限
+SQL_BATCH_SIZE = 500
+
+EVICTION_ORDER = {
+    'lru': "accessed_at",
+    'lfu': "hits, accessed_at"
+}
+
+
+def _json_default(value):
+    """序列化检索结果中的 numpy 标量和数组"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
 
 class CacheManager:
-    def __init__(self):
+    """基于 SQLite（WAL 模式）的回答缓存
+
+    单文件存储，按键 O(1) 查找；过期时间和访问时间均有索引，清理过期条目
+    是一条按索引的 DELETE；超过条目数或字节数上限时按 LRU/LFU 淘汰。
+    多进程同时读写由 SQLite 的事务保证原子性。
+
+    每个条目记录生成时的索引版本（epoch）和所引用的片段ID：索引全量重建后
+    旧版本条目不再命中，增量更新时只失效引用了被删除或变更片段的条目。
+    """
+
+    def __init__(self, db_path: str = None):
         self.cache_dir = os.path.join(settings.FAISS_INDEX_PATH, "cache")
         if not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
+        self.db_path = db_path or os.path.join(self.cache_dir, "answers.db")
 
         # 缓存过期时间（小时）
-        self.cache_expiry_hours = 24
+        self.cache_expiry_hours = settings.CACHE_EXPIRY_HOURS
+        self.max_entries = settings.CACHE_MAX_ENTRIES
+        self.max_bytes = settings.CACHE_MAX_BYTES
+        if settings.CACHE_EVICTION_POLICY not in EVICTION_ORDER:
+            raise ValueError(f"不支持的缓存淘汰策略: {settings.CACHE_EVICTION_POLICY}")
+        self.eviction_order = EVICTION_ORDER[settings.CACHE_EVICTION_POLICY]
+
+        # sqlite3 连接不能跨线程共享，每个线程各自持有一个
+        self._local = threading.local()
+        conn = self._connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.executescript(DROP_SCHEMA)
+        conn.executescript(SCHEMA + f"PRAGMA user_version = {SCHEMA_VERSION};")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
 
     def _get_cache_key(self, query: str, filters: Dict[str, Any] = None) -> str:
         """生成缓存键"""
         cache_str = query + str(filters or {})
         return hashlib.md5(cache_str.encode()).hexdigest()
 
-    def get_cached_result(self, query: str, filters: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
-        """获取缓存结果"""
+    @staticmethod
+    def serialize_filters(filters: Dict[str, Any] = None) -> str:
+        """筛选条件的规范化文本，与缓存表中的 filters 列一致"""
+        return json.dumps(filters or {}, ensure_ascii=False, sort_keys=True)
+
+    def get_cached_result(self, query: str, filters: Dict[str, Any] = None,
+                          epoch: str = None) -> Optional[Dict[str, Any]]:
+        """获取缓存结果，指定 epoch 时其他索引版本生成的条目视为失效"""
         if not settings.CACHE_ENABLED:
             return None
+        return self.get_by_key(self._get_cache_key(query, filters), epoch)
 
-        cache_key = self._get_cache_key(query, filters)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.pkl")
-
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, 'rb') as f:
-                    cache_data = pickle.load(f)
-
-                # 检查是否过期
-                cache_time = datetime.fromisoformat(cache_data['timestamp'])
-                if datetime.now() - cache_time < timedelta(hours=self.cache_expiry_hours):
-                    return cache_data['result']
-                else:
-                    # 删除过期缓存
-                    os.remove(cache_file)
-            except Exception as e:
-                print(f"缓存读取失败: {e}")
-
-        return None
-
-    def set_cached_result(self, query: str, result: Dict[str, Any], filters: Dict[str, Any] = None):
-        """设置缓存结果"""
+    def get_by_key(self, cache_key: str, epoch: str = None) -> Optional[Dict[str, Any]]:
+        """按缓存键获取缓存结果"""
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT result, expires_at, epoch FROM answers WHERE key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now or (epoch is not None and row[2] != epoch):
+                # 删除过期或索引版本不符的缓存
+                conn.execute("DELETE FROM answers WHERE key = ? AND expires_at = ?", (cache_key, row[1]))
+                return None
+            conn.execute(
+                "UPDATE answers SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, cache_key)
+            )
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"缓存读取失败: {e}")
+            return None
+
+    def set_cached_result(self, query: str, result: Dict[str, Any], filters: Dict[str, Any] = None,
+                          epoch: str = None, chunk_ids: Iterable[int] = ()):
+        """设置缓存结果，记录索引版本和回答引用的片段ID"""
         if not settings.CACHE_ENABLED:
             return
 
         cache_key = self._get_cache_key(query, filters)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.pkl")
-
-        cache_data = {
-            'query': query,
-            'result': result,
-            'timestamp': datetime.now().isoformat(),
-            'filters': filters
-        }
+        now = time.time()
+        try:
+            payload = json.dumps(result, ensure_ascii=False, default=_json_default)
+            with self._transaction() as conn:
+                # 先删除旧条目以便触发器正确维护用量统计
+                conn.execute("DELETE FROM answers WHERE key = ?", (cache_key,))
+                conn.execute(
+                    "INSERT INTO answers (key, query, filters, epoch, result, size, created_at, expires_at, "
+                    "accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (cache_key, query, self.serialize_filters(filters), epoch or '', payload,
+                     len(payload.encode('utf-8')), now, now + self.cache_expiry_hours * 3600, now)
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO answer_chunks (chunk_id, key) VALUES (?, ?)",
+                    [(int(chunk_id), cache_key) for chunk_id in chunk_ids]
+                )
+                self._evict(conn)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"缓存写入失败: {e}")
 
+    def set_question_embedding(self, query: str, filters: Dict[str, Any], model_id: str,
+                               embedding: np.ndarray) -> Optional[str]:
+        """为已缓存的回答记录问题向量，回答不存在时不写入，返回缓存键"""
+        cache_key = self._get_cache_key(query, filters)
+        blob = np.ascontiguousarray(embedding, dtype='float32').reshape(-1).tobytes()
         try:
-            with open(cache_file, 'wb') as f:
-                pickle.dump(cache_data, f)
-        except Exception as e:
+            inserted = self._connection().execute(
+                "INSERT OR REPLACE INTO question_embeddings (key, model_id, embedding) "
+                "SELECT key, ?, ? FROM answers WHERE key = ?",
+                (model_id, blob, cache_key)
+            ).rowcount
+        except sqlite3.Error as e:
             print(f"缓存写入失败: {e}")
+            return None
+        return cache_key if inserted else None
+
+    def load_question_embeddings(self, model_id: str) -> List[Tuple[str, str, np.ndarray]]:
+        """读取指定模型的全部问题向量，返回 (缓存键, 筛选条件JSON, 向量)"""
+        rows = self._connection().execute(
+            "SELECT q.key, a.filters, q.embedding FROM question_embeddings q "
+            "JOIN answers a ON a.key = q.key WHERE q.model_id = ?",
+            (model_id,)
+        ).fetchall()
+        return [(key, filters, np.frombuffer(blob, dtype='float32')) for key, filters, blob in rows]
+
+    def _evict(self, conn: sqlite3.Connection):
+        """超过容量上限时按淘汰策略删除条目"""
+        while True:
+            entries, total_bytes = conn.execute(
+                "SELECT entries, bytes FROM cache_usage WHERE id = 1"
+            ).fetchone()
+            excess = entries - self.max_entries
+            if excess <= 0 and total_bytes <= self.max_bytes:
+                return
+            conn.execute(
+                f"DELETE FROM answers WHERE key IN "
+                f"(SELECT key FROM answers ORDER BY {self.eviction_order} LIMIT ?)",
+                (max(excess, 1),)
+            )
+
+    def clear_expired_cache(self) -> int:
+        """清理过期缓存，返回清理数量"""
+        return self._connection().execute(
+            "DELETE FROM answers WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+
+    def invalidate_chunks(self, chunk_ids: Iterable[int]) -> int:
+        """删除引用了指定片段的缓存条目，返回删除数量"""
+        chunk_ids = sorted({int(chunk_id) for chunk_id in chunk_ids})
+        removed = 0
+        with self._transaction() as conn:
+            for start in range(0, len(chunk_ids), SQL_BATCH_SIZE):
+                batch = chunk_ids[start:start + SQL_BATCH_SIZE]
+                removed += conn.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answer_chunks WHERE chunk_id IN "
+                    f"({', '.join('?' * len(batch))}))",
+                    batch
+                ).rowcount
+        return removed
+
+    def invalidate_epoch(self, epoch: str) -> int:
+        """删除其他索引版本生成的缓存条目，返回删除数量"""
+        return self._connection().execute("DELETE FROM answers WHERE epoch != ?", (epoch,)).rowcount
+
+    def clear(self):
+        """清空全部缓存"""
+        self._connection().execute("DELETE FROM answers")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存用量统计"""
+        entries, total_bytes = self._connection().execute(
+            "SELECT entries, bytes FROM cache_usage WHERE id = 1"
+        ).fetchone()
+        return {
+            'entries': entries,
+            'bytes': total_bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes
+        }
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE 事务：写锁在开始时获取，避免读后升级写锁时死锁"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
 
-    def clear_expired_cache(self):
-        """清理过期缓存"""
-        for filename in os.listdir(self.cache_dir):
-            if filename.endswith('.pkl'):
-                filepath = os.path.join(self.cache_dir, filename)
-                try:
-                    with open(filepath, 'rb') as f:
-                        cache_data = pickle.load(f)
-
-                    cache_time = datetime.fromisoformat(cache_data['timestamp'])
-                    if datetime.now() - cache_time >= timedelta(hours=self.cache_expiry_hours):
-                        os.remove(filepath)
-                except Exception as e:
-                    print(f"缓存清理失败 {filename}: {e}")
\ No newline at end of file
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
@@ -0,0 +1,148 @@
+import re
+from typing import Any, Dict, List, Set, Tuple
+
+from config.settings import settings
+
+# 长段落切分时优先在句末断开
+SENTENCE_END = re.compile(r'[。！？；.!?;]\s*')
+
+TABLE_MARKER = '【表格】'
+
+
+def describe_location(chunk: Dict[str, Any]) -> str:
+    """生成片段在原文中的位置描述，用于引用标注"""
+    start = chunk.get('paragraph_start')
+    end = chunk.get('paragraph_end')
+    if start is None:
+        return "全文"
+    location = f"第{start + 1}段" if start == end else f"第{start + 1}-{end + 1}段"
+
+    # PDF 片段带页码（从1开始），段落序号为全文序号
+    page_start = chunk.get('page_start')
+    page_end = chunk.get('page_end')
+    if page_start is None:
+        return location
+    pages = f"第{page_start}页" if page_start == page_end else f"第{page_start}-{page_end}页"
+    return f"{pages} {location}"
+
+
+class TextChunker:
+    """将文档按段落切分为带父文档与偏移信息的检索片段"""
+
+    def __init__(self, chunk_size: int = None, chunk_overlap: int = None):
+        self.chunk_size = chunk_size or settings.CHUNK_SIZE
+        self.chunk_overlap = min(chunk_overlap if chunk_overlap is not None else settings.CHUNK_OVERLAP,
+                                 self.chunk_size // 2)
+
+    def chunk_document(self, doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """切分单个文档
+
+        按 content 中以空行分隔的块切分（块内保留【表格】【公式】格式标签），
+        不直接使用 paragraphs。_build_json_structure 以空行连接各段落且段落内
+        不含空行，所以块与 paragraphs 一一对应，段落序号可用于引用定位和
+        paragraph_pages；content 中没有空行时整篇视为一个段落，按窗口切分。
+        文档带 paragraph_pages（PDF）时片段记录起止页码。
+        """
+        paragraphs = doc.get('content', '').split('\n\n')
+        paragraph_pages = doc.get('paragraph_pages')
+        if paragraph_pages is not None and len(paragraph_pages) != len(paragraphs):
+            paragraph_pages = None
+        pieces = []
+        for para_index, para in enumerate(paragraphs):
+            if para.strip():
+                pieces.extend(self._split_paragraph(para_index, para))
+        # 表格块单独成为片段，不与相邻段落合并
+        tables = {para_index for para_index, para in enumerate(paragraphs) if para.startswith(TABLE_MARKER)}
+
+        chunks = []
+        for group in self._group_pieces(pieces, tables):
+            chunks.append({
+                "title": doc['title'],
+                "format_source": doc['format_source'],
+                "file_path": doc['file_path'],
+                "content": "\n\n".join(paragraphs[i][start:end] for i, start, end in group),
+                "chunk_index": len(chunks),
+                "paragraph_start": group[0][0],
+                "paragraph_end": group[-1][0],
+                "char_start": group[0][1],
+                "char_end": group[-1][2]
+            })
+            if paragraph_pages is not None:
+                chunks[-1]["page_start"] = paragraph_pages[group[0][0]]
+                chunks[-1]["page_end"] = paragraph_pages[group[-1][0]]
+
+        if not chunks:
+            # 空文档也保留一个片段，保证可以按标题检索
+            chunks.append({
+                "title": doc['title'],
+                "format_source": doc['format_source'],
+                "file_path": doc['file_path'],
+                "content": "",
+                "chunk_index": 0,
+                "paragraph_start": None,
+                "paragraph_end": None,
+                "char_start": 0,
+                "char_end": 0
+            })
+        return chunks
+
+    def _split_paragraph(self, para_index: int, para: str) -> List[Tuple[int, int, int]]:
+        """将超长段落切为带重叠的窗口，返回 (段落序号, 起始偏移, 结束偏移)"""
+        if len(para) <= self.chunk_size:
+            return [(para_index, 0, len(para))]
+
+        pieces = []
+        start = 0
+        while start < len(para):
+            end = min(start + self.chunk_size, len(para))
+            if end < len(para):
+                # 在窗口后半部分寻找最后一个句末位置
+                boundary = None
+                for match in SENTENCE_END.finditer(para, start + self.chunk_size // 2, end):
+                    boundary = match.end()
+                if boundary:
+                    end = boundary
+            pieces.append((para_index, start, end))
+            if end >= len(para):
+                break
+            start = max(end - self.chunk_overlap, start + 1)
+        return pieces
+
+    def _group_pieces(self, pieces: List[Tuple[int, int, int]],
+                      standalone: Set[int] = frozenset()) -> List[List[Tuple[int, int, int]]]:
+        """将相邻的短段落合并到 chunk_size 以内，相邻片段之间保留重叠段落
+
+        standalone 中的段落（表格块）不与其他段落合并，也不作为重叠段落。
+        """
+        groups = []
+        current = []
+        current_len = 0
+
+        for piece in pieces:
+            piece_len = piece[2] - piece[1]
+            if current and (piece[0] in standalone or current[-1][0] in standalone):
+                groups.append(current)
+                current, current_len = [], 0
+            elif current and current_len + piece_len + 2 > self.chunk_size:
+                groups.append(current)
+
+                # 上一片段末尾不超过 overlap 的整段作为重叠
+                carry = []
+                carry_len = 0
+                for prev in reversed(current[1:]):
+                    prev_len = prev[2] - prev[1]
+                    if carry_len + prev_len > self.chunk_overlap:
+                        break
+                    carry.insert(0, prev)
+                    carry_len += prev_len + 2
+                if carry_len + piece_len + 2 > self.chunk_size:
+                    carry, carry_len = [], 0
+                current = carry
+                current_len = carry_len
+
+            current.append(piece)
+            current_len += piece_len + 2
+
+        if current:
+            groups.append(current)
+        return groups
@@ -1,31 +1,123 @@
 import os
 import json
-import PyPDF2
-from docx import Document
-import openpyxl
-import pdf2image
-import pytesseract
-from PIL import Image
-import rispy
 import re
-from typing import Dict, List, Any
+import hashlib
+import unicodedata
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import subprocess
 import tempfile
 
 from config.settings import settings
+from utils.ingest_manifest import file_sha256
+from utils.parse_cache import ParseCache
+
+# 解析器版本，解析逻辑改变输出时递增，使解析缓存失效
+PROCESSOR_VERSION = 3
+
+# 解析结果受表格切块配置影响的格式，以及可能走 OCR 的格式（用于解析缓存键）
+TABLE_FORMATS = {'.xlsx', '.docx'}
+OCR_FORMATS = {'.pdf', '.caj', '.jpg', '.png'}
+
+
+def _build_replacements() -> Dict[str, str]:
+    """字符替换表：PDF 提取常见的康熙部首（如"⼤"）、兼容汉字和连字（如"ﬁ"）还原为常用字符，删除零宽字符
+    （制表符、全角空格等空白在逐行处理时压缩，不在此替换）"""
+    replacements = {}
+    for start, end in ((0x2F00, 0x2FDF), (0xF900, 0xFAFF), (0xFB00, 0xFB06)):
+        for code in range(start, end + 1):
+            normalized = unicodedata.normalize('NFKC', chr(code))
+            if normalized != chr(code):
+                replacements[chr(code)] = normalized
+    replacements.update({char: '' for char in '\u200b\u200c\u200d\u2060\ufeff\u00ad'})
+    return replacements
+
+
+CHAR_REPLACEMENTS = _build_replacements()
+# 需替换的字符很少出现，正则字符集查找比 str.translate 逐字符查表快
+REPLACED_CHARS = re.compile('[' + ''.join(re.escape(char) for char in sorted(CHAR_REPLACEMENTS)) + ']')
+
+# 整行为页码的页眉页脚："第 3 页"、"第3页 共10页"、"- 3 -"、"3 / 10"、"Page 3 of 10"
+# "3 / 10" 形式还需页码不大于总页数，避免删去"2023/10"这类正文行
+PAGE_NOISE = re.compile(r'第\s*\d+\s*页(?:\s*[,，/／]?\s*共\s*\d+\s*页)?|-\s*\d+\s*-|'
+                        r'(?P<page>\d{1,4})\s*/\s*(?P<total>\d{1,4})|page\s+\d+(?:\s+of\s+\d+)?',
+                        re.IGNORECASE)
+PAGE_NOISE_MAX_CHARS = 20
+
+# 表格行：首尾为竖线（Markdown/文本表格）、+---+ 边框行，或至少三个竖线
+TABLE_ROW = re.compile(r'\|.*\|$|\+[-=+]+\+$|(?:[^|]*\|){3}')
+
+# 公式：$...$、$$...$$、\(...\)、\[...\] 和 LaTeX 公式环境
+FORMULA = re.compile(r'\$\$.+?\$\$|\$[^$\n]+\$|\\\(.+?\\\)|\\\[.+?\\\]'
+                     r'|\\begin\{(?:equation|align|gather|multline|eqnarray|displaymath)\*?\}', re.DOTALL)
+
+# 合并换行时两侧均为中日韩字符或全角标点则不加空格
+CJK_CHAR = re.compile(r'[\u2e80-\u9fff\uf900-\ufaff\uff00-\uffef]')
 
 
 class DocumentProcessor:
-    def __init__(self):
-        self.supported_formats = settings.SUPPORTED_EXTENSIONS
+    """文档解析器；各格式的解析库在首次处理该格式时才导入
 
-    def process_document(self, file_path: str) -> Dict[str, Any]:
-        """处理单个文档，返回标准化的JSON结构"""
+    解析结果按文件内容哈希缓存（PARSE_CACHE_ENABLED），调整切分或重建索引时
+    不再重复解析PDF、OCR和CAJ转换。
+    """
+
+    def __init__(self, use_cache: bool = None):
+        self.supported_formats = settings.SUPPORTED_EXTENSIONS
+        self._ocr = None
+        use_cache = settings.PARSE_CACHE_ENABLED if use_cache is None else use_cache
+        self.parse_cache = ParseCache() if use_cache else None
+
+    @property
+    def ocr(self):
+        if self._ocr is None:
+            from utils.ocr import PageOCR
+            self._ocr = PageOCR()
+        return self._ocr
+
+    def process_document(self, file_path: str, file_hash: str = None) -> Dict[str, Any]:
+        """处理单个文档，返回标准化的JSON结构
+
+        file_hash 为调用方已计算的文件内容哈希，用作解析缓存和OCR缓存的键。
+        """
         file_ext = os.path.splitext(file_path)[1].lower()
 
         if file_ext not in self.supported_formats:
             raise ValueError(f"不支持的文档格式: {file_ext}")
 
+        if self.parse_cache is None:
+            return self._parse(file_path, file_ext, file_hash)
+
+        file_hash = file_hash or file_sha256(file_path)
+        key = self.cache_key(file_ext)
+        cached = self.parse_cache.get(file_hash, key)
+        if cached is not None:
+            # 内容相同的文件可能已改名或移动；ENW/RIS 的标题取自记录，保持不变
+            document = cached.document
+            if cached.title_from_filename:
+                document['title'] = os.path.basename(file_path)
+            document['file_path'] = file_path
+            return document
+
+        document = self._parse(file_path, file_ext, file_hash)
+        # 内容为空多为转换工具或OCR不可用，不缓存，下次重试
+        if document['content']:
+            self.parse_cache.put(file_hash, key, document,
+                                 title_from_filename=document['title'] == os.path.basename(file_path))
+        return document
+
+    @staticmethod
+    def cache_key(file_ext: str) -> str:
+        """解析缓存键：扩展名、解析器版本和影响该格式解析结果的配置"""
+        file_ext = file_ext.lower()
+        options = [PROCESSOR_VERSION]
+        if file_ext in TABLE_FORMATS:
+            options += [settings.TABLE_BLOCK_ROWS, settings.CHUNK_SIZE]
+        if file_ext in OCR_FORMATS:
+            options += [settings.OCR_DPI, settings.OCR_LANG, settings.OCR_MIN_PAGE_CHARS]
+        fingerprint = hashlib.sha1(json.dumps(options).encode('utf-8')).hexdigest()[:12]
+        return f"{file_ext.lstrip('.')}-v{PROCESSOR_VERSION}-{fingerprint}"
+
+    def _parse(self, file_path: str, file_ext: str, file_hash: str = None) -> Dict[str, Any]:
         processors = {
             '.txt': self._process_txt,
             '.md': self._process_md,
@@ -41,19 +133,45 @@ class DocumentProcessor:
             '.png': self._process_image
         }
 
+        if file_ext in OCR_FORMATS:
+            # OCR缓存按原文件的内容哈希存放
+            return processors[file_ext](file_path, file_hash)
         return processors[file_ext](file_path)
 
-    def _extract_text_from_scanned_pdf(self, pdf_path: str) -> str:
-        """从扫描版PDF提取文本"""
+    def _extract_pdf_pages(self, pdf_path: str, file_hash: str = None) -> List[str]:
+        """逐页提取文本：只打开一次PDF，文字层过少的页面（扫描页）走OCR
+
+        file_hash 为OCR缓存键，默认为 pdf_path 的内容哈希。
+        """
         try:
-            images = pdf2image.convert_from_path(pdf_path)
-            text = ""
-            for image in images:
-                text += pytesseract.image_to_string(image, lang='chi_sim+eng')
-            return text
+            import PyPDF2
+            with open(pdf_path, 'rb') as f:
+                page_texts = []
+                for page in PyPDF2.PdfReader(f).pages:
+                    try:
+                        page_texts.append(page.extract_text() or "")
+                    except Exception:
+                        # 单页解析失败时该页走OCR
+                        page_texts.append("")
         except Exception as e:
-            print(f"OCR处理失败: {e}")
-            return ""
+            print(f"PDF文字层解析失败，全部页面使用OCR: {e}")
+            try:
+                import pdf2image
+                page_texts = [""] * pdf2image.pdfinfo_from_path(pdf_path)['Pages']
+            except Exception as e:
+                print(f"OCR处理失败: {e}")
+                return []
+
+        scanned = [page for page, text in enumerate(page_texts, start=1)
+                   if len(text.strip()) < settings.OCR_MIN_PAGE_CHARS]
+        if scanned:
+            try:
+                ocr_texts = self.ocr.ocr_pdf(pdf_path, scanned, file_hash)
+            except Exception as e:
+                print(f"OCR处理失败: {e}")
+                ocr_texts = {}
+            page_texts = [ocr_texts.get(page, text) for page, text in enumerate(page_texts, start=1)]
+        return page_texts
 
     def _process_txt(self, file_path: str) -> Dict[str, Any]:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -66,39 +184,44 @@ class DocumentProcessor:
         return self._build_json_structure(file_path, content)
 
     def _process_docx(self, file_path: str) -> Dict[str, Any]:
+        """处理DOCX：按原文顺序提取段落和表格，表格切分为表格块"""
+        from docx import Document
+        from docx.table import Table
         doc = Document(file_path)
-        content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-        return self._build_json_structure(file_path, content)
 
-    def _process_pdf(self, file_path: str) -> Dict[str, Any]:
-        text = ""
+        def blocks():
+            table_count = 0
+            for item in doc.iter_inner_content():
+                if isinstance(item, Table):
+                    table_count += 1
+                    rows = ((row_number, [cell.text for cell in row.cells])
+                            for row_number, row in enumerate(item.rows, start=1))
+                    yield from self._iter_table_blocks(f"表格{table_count}", rows)
+                else:
+                    yield None, item.text
+
+        return self._build_json_structure(file_path, blocks=blocks())
+
+    def _process_pdf(self, file_path: str, file_hash: str = None) -> Dict[str, Any]:
+        """处理PDF：逐页选择文字层或OCR，并记录每个段落所在页码"""
+        return self._build_json_structure(file_path, page_texts=self._extract_pdf_pages(file_path, file_hash))
+
+    def _process_caj(self, file_path: str, file_hash: str = None) -> Dict[str, Any]:
+        """处理CAJ文件：先转换为PDF再处理
+
+        转换出的临时PDF每次内容哈希可能不同，OCR缓存按CAJ文件本身的哈希存放，
+        重新入库时可以命中，也不会被缓存清理当作已删除文件的条目。
+        """
         try:
-            # 首先尝试直接提取文本
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-
-            # 如果文本太少，可能是扫描件，使用OCR
-            if len(text.strip()) < 100:
-                ocr_text = self._extract_text_from_scanned_pdf(file_path)
-                if ocr_text:
-                    text = ocr_text
-
-        except Exception as e:
-            print(f"PDF处理错误: {e}")
-            text = self._extract_text_from_scanned_pdf(file_path)
-
-        return self._build_json_structure(file_path, text)
-
-    def _process_caj(self, file_path: str) -> Dict[str, Any]:
-        """处理CAJ文件：先转换为PDF再处理"""
-        try:
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_pdf:
+            file_hash = file_hash or file_sha256(file_path)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                pdf_path = os.path.join(tmp_dir, "converted.pdf")
                 # 使用caj2pdf转换（需要安装caj2pdf）
-                subprocess.run(['caj2pdf', 'convert', file_path, '-o', temp_pdf.name],
+                subprocess.run(['caj2pdf', 'convert', file_path, '-o', pdf_path],
                                check=True, capture_output=True)
-                return self._process_pdf(temp_pdf.name)
+                # 标题、路径和格式仍记为原CAJ文件
+                return self._build_json_structure(file_path,
+                                                  page_texts=self._extract_pdf_pages(pdf_path, file_hash))
         except Exception as e:
             print(f"CAJ转换失败: {e}")
             return self._build_json_structure(file_path, "")
@@ -119,7 +242,12 @@ class DocumentProcessor:
                 if len(parts) > 1:
                     field = parts[0][1:]
                     value = parts[1].strip()
-                    structured_info[field] = value
+                    if field in structured_info:
+                        # 作者（%A）等字段可重复出现，保留全部取值
+                        previous = structured_info[field]
+                        structured_info[field] = (previous if isinstance(previous, list) else [previous]) + [value]
+                    else:
+                        structured_info[field] = value
 
         return {
             "title": structured_info.get('T', ''),
@@ -131,6 +259,7 @@ class DocumentProcessor:
 
     def _process_ris(self, file_path: str) -> Dict[str, Any]:
         """处理RIS文件"""
+        import rispy
         with open(file_path, 'r', encoding='utf-8') as f:
             entries = rispy.load(f)
 
@@ -150,45 +279,103 @@ class DocumentProcessor:
         return self._build_json_structure(file_path, "PPTX内容提取")
 
     def _process_xlsx(self, file_path: str) -> Dict[str, Any]:
-        workbook = openpyxl.load_workbook(file_path)
-        content = ""
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            content += f"【表格】工作表: {sheet_name}\n"
-            for row in sheet.iter_rows(values_only=True):
-                content += " | ".join([str(cell) if cell else "" for cell in row]) + "\n"
-            content += "\n"
-        return self._build_json_structure(file_path, content)
+        """处理XLSX：只读模式逐行读取（内存占用与行数无关），每个工作表切分为表格块"""
+        import openpyxl
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+
+        def blocks():
+            for sheet in workbook.worksheets:
+                # 部分工具写入的表格范围不准确，忽略后按实际行读取
+                sheet.reset_dimensions()
+                rows = ((row_number, list(row))
+                        for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1))
+                yield from self._iter_table_blocks(f"工作表: {sheet.title}", rows)
+
+        try:
+            return self._build_json_structure(file_path, blocks=blocks())
+        finally:
+            workbook.close()
+
+    def _iter_table_blocks(self, label: str, rows: Iterable[Tuple[int, List[Any]]]) -> Iterator[Tuple[str, str]]:
+        """将表格行切分为表格块
+
+        rows 为 (行号, 单元格值)。每块不超过 TABLE_BLOCK_ROWS 行、尽量不超过 CHUNK_SIZE 字符，
+        首行注明表名和行号范围并重复表头，单独成为一个片段即可理解。逐行处理，不保留整张表。
+        """
+        header = None
+        lines = []
+        size = 0
+        first_row = last_row = None
+        for row_number, cells in rows:
+            cells = [" ".join(str(cell).split()) if cell is not None else "" for cell in cells]
+            while cells and not cells[-1]:
+                cells.pop()
+            if not any(cells):
+                continue
+            line = " | ".join(cells)
+            if header is None:
+                header, first_row, last_row = line, row_number, row_number
+                budget = settings.CHUNK_SIZE - len(label) - len(header) - 20
+                continue
+
+            if lines and (len(lines) >= settings.TABLE_BLOCK_ROWS or size + len(line) + 1 > budget):
+                yield "表格", f"{label} 第{first_row}-{last_row}行\n{header}\n" + "\n".join(lines)
+                lines, size = [], 0
+            if not lines:
+                first_row = row_number
+            lines.append(line)
+            size += len(line) + 1
+            last_row = row_number
+
+        if lines:
+            yield "表格", f"{label} 第{first_row}-{last_row}行\n{header}\n" + "\n".join(lines)
+        elif header is not None:
+            yield "表格", f"{label} 第{first_row}行\n{header}"
 
     def _process_tex(self, file_path: str) -> Dict[str, Any]:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         return self._build_json_structure(file_path, content)
 
-    def _process_image(self, file_path: str) -> Dict[str, Any]:
+    def _process_image(self, file_path: str, file_hash: str = None) -> Dict[str, Any]:
         """处理图片文件"""
         try:
-            image = Image.open(file_path)
-            text = pytesseract.image_to_string(image, lang='chi_sim+eng')
+            text = self.ocr.ocr_image(file_path, file_hash)
             return self._build_json_structure(file_path, text)
         except Exception as e:
             print(f"图片处理失败: {e}")
             return self._build_json_structure(file_path, "")
 
-    def _build_json_structure(self, file_path: str, content: str) -> Dict[str, Any]:
-        """构建标准化的JSON结构"""
-        # 清理冗余信息
-        cleaned_content = self._clean_content(content)
-
-        # 提取段落
-        paragraphs = self._split_paragraphs(cleaned_content)
-
-        # 识别格式标签
-        formatted_content = self._add_format_tags(paragraphs)
-
-        return {
+    def _build_json_structure(self, file_path: str, content: str = "", page_texts: List[str] = None,
+                              blocks: Iterable[Tuple[str, str]] = None) -> Dict[str, Any]:
+        """构建标准化的JSON结构
+
+        提供 page_texts（逐页文本）时按页提取段落，paragraph_pages 记录每个段落的页码（从1开始）。
+        提供 blocks 时按顺序处理 (类型, 文本)：类型为 None 的文本规范化后分段并识别格式，
+        "表格" 为已切分好的表格块，原样作为一个【表格】段落。
+        """
+        paragraph_pages = None
+        if page_texts is not None:
+            paragraph_pages = []
+            sections = ((page, None, text) for page, text in enumerate(page_texts, start=1))
+        elif blocks is not None:
+            sections = ((None, kind, text) for kind, text in blocks)
+        else:
+            sections = [(None, None, content)]
+
+        paragraphs = []
+        tagged_paragraphs = []
+        for page, kind, text in sections:
+            section_blocks = self._split_blocks(text) if kind is None else [(kind, text)]
+            for tag, para in section_blocks:
+                paragraphs.append(para)
+                tagged_paragraphs.append(f"【{tag}】{para}" if tag else para)
+            if paragraph_pages is not None:
+                paragraph_pages.extend([page] * len(section_blocks))
+
+        document = {
             "title": os.path.basename(file_path),
-            "content": formatted_content,
+            "content": "\n\n".join(tagged_paragraphs),
             "structured_info": {
                 "file_type": os.path.splitext(file_path)[1],
                 "file_size": os.path.getsize(file_path),
@@ -198,30 +385,53 @@ class DocumentProcessor:
             "file_path": file_path,
             "paragraphs": paragraphs
         }
-
-    def _clean_content(self, content: str) -> str:
-        """清理冗余信息"""
-        # 移除过多的空白字符
-        content = re.sub(r'\s+', ' ', content)
-        # 移除页眉页脚等常见噪音（根据实际情况调整）
-        content = re.sub(r'第\s*\d+\s*页', '', content)
-        return content.strip()
-
-    def _split_paragraphs(self, content: str) -> List[str]:
-        """将内容分割为段落"""
-        paragraphs = re.split(r'\n\s*\n', content)
-        return [p.strip() for p in paragraphs if p.strip()]
-
-    def _add_format_tags(self, paragraphs: List[str]) -> str:
-        """添加格式标签"""
-        tagged_content = []
-        for para in paragraphs:
-            # 检测表格（简单的启发式规则）
-            if re.search(r'\|\s*.+\s*\|', para) or re.search(r'\+[-]+\+', para):
-                tagged_content.append(f"【表格】{para}")
-            # 检测公式（简单的启发式规则）
-            elif re.search(r'\$[^$]+\$|\\\(.*\\\)|\\\[.*\\\]', para):
-                tagged_content.append(f"【公式】{para}")
-            else:
-                tagged_content.append(para)
-        return "\n\n".join(tagged_content)
\ No newline at end of file
+        if paragraph_pages is not None:
+            document["paragraph_pages"] = paragraph_pages
+            document["page_count"] = len(page_texts)
+        return document
+
+    def _split_blocks(self, text: str) -> List[Tuple[Optional[str], str]]:
+        """规范化文本并切分为段落块，返回 (格式标签, 段落)，格式标签为 "表格"、"公式" 或 None
+
+        逐行单遍处理：行内空白压缩为单个空格，整行页码删除，空行分段；表格行与正文行
+        交替处也分段，使表格单独成块。表格块保留换行，正文块的各行合并为一行。
+        """
+        blocks = []
+        lines = []
+        in_table = False
+        text = REPLACED_CHARS.sub(lambda match: CHAR_REPLACEMENTS[match.group()], text)
+        for line in text.splitlines():
+            line = " ".join(line.split())
+            if not line:
+                if lines:
+                    blocks.append(self._finish_block(lines, in_table))
+                    lines = []
+                continue
+            noise = PAGE_NOISE.fullmatch(line) if len(line) <= PAGE_NOISE_MAX_CHARS else None
+            if noise and (noise.group('page') is None or int(noise.group('page')) <= int(noise.group('total'))):
+                continue
+            is_table = ('|' in line or '+' in line) and TABLE_ROW.match(line) is not None
+            if lines and is_table != in_table:
+                blocks.append(self._finish_block(lines, in_table))
+                lines = []
+            lines.append(line)
+            in_table = is_table
+        if lines:
+            blocks.append(self._finish_block(lines, in_table))
+        return blocks
+
+    @staticmethod
+    def _finish_block(lines: List[str], is_table: bool) -> Tuple[Optional[str], str]:
+        if is_table:
+            return "表格", "\n".join(lines)
+
+        # PDF 等来源的硬换行：中文之间直接相连，英文断词连字符保留并直接相连，其余以空格相连
+        parts = [lines[0]]
+        for line in lines[1:]:
+            prev = parts[-1]
+            if not ((CJK_CHAR.match(prev[-1]) and CJK_CHAR.match(line[0]))
+                    or (prev[-1] == '-' and prev[-2:-1].isalpha() and line[0].islower())):
+                parts.append(' ')
+            parts.append(line)
+        para = "".join(parts)
+        return ("公式" if FORMULA.search(para) else None), para
\ No newline at end of file
@@ -0,0 +1,329 @@
+import os
+import glob
+import bisect
+import json
+import mmap
+import shutil
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from utils.search_filter import content_tags, match_document, tag_mask
+
+# 磁盘格式版本，结构变化时递增
+FORMAT_VERSION = 1
+
+META_FILE = "docstore.json"
+
+# 片段内容哈希（SHA-1）字节数
+HASH_BYTES = 20
+
+# 片段元数据表，每行一个片段；文本在 text_start:text_end 的字节区间内
+CHUNK_DTYPE = np.dtype([
+    ('chunk_id', 'int64'),
+    ('doc', 'int32'),
+    ('chunk_index', 'int32'),
+    ('paragraph_start', 'int32'),
+    ('paragraph_end', 'int32'),
+    ('char_start', 'int64'),
+    ('char_end', 'int64'),
+    ('text_start', 'int64'),
+    ('text_end', 'int64'),
+    ('content_hash', 'S20'),
+    # PDF 片段的起止页码（从1开始），其他格式为 -1
+    ('page_start', 'int32'),
+    ('page_end', 'int32')
+])
+
+
+class DocumentStore:
+    """列式片段存储
+
+    片段元数据存为定长结构化数组 chunks.<代>.npy，文本按 UTF-8 依次写入
+    text.<代>.bin，两者加载时均以只读内存映射打开，读取片段时只解码命中的
+    字节区间。tags.<代>.npy 为入库时计算的片段内容标签位（表格、公式），
+    供检索前筛选。父文档元数据（标题、格式、路径等）每个文件只存一份，片段行
+    通过 doc 列引用。docstore.json 记录当前代号和文档表，最后写入，作为
+    提交点；旧代文件在提交后删除，仍在映射旧文件的进程不受影响。
+
+    片段ID按分配顺序递增，删除不改变顺序，按ID查找使用二分查找。
+    """
+
+    def __init__(self):
+        self.rows = np.zeros(0, dtype=CHUNK_DTYPE)
+        self.tags = np.zeros(0, dtype='uint8')
+        # 父文档元数据，按文件路径索引；_paths 与 doc 列的取值一一对应
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self._paths: List[str] = []
+        self._doc_rows: Dict[str, int] = {}
+        self._text = b''
+        # 新增片段的文本暂存在内存，保存时与已映射的文本一起写入新文件
+        self._tail = bytearray()
+        self._tail_start = 0
+        # 当前映射的文本文件；删除过片段后保存时需要重写以回收字节
+        self._text_path: Optional[str] = None
+        self._compact = False
+        self.meta: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def chunk_ids(self) -> np.ndarray:
+        return self.rows['chunk_id']
+
+    def add_document(self, doc_meta: Dict[str, Any], chunks: List[Dict[str, Any]]):
+        """追加一个文档及其片段，片段需已带 chunk_id 和 content_hash"""
+        path = doc_meta['file_path']
+        self.documents[path] = doc_meta
+        self._doc_rows[path] = len(self._paths)
+        self._paths.append(path)
+
+        rows = np.zeros(len(chunks), dtype=CHUNK_DTYPE)
+        for row, chunk in zip(rows, chunks):
+            text = chunk['content'].encode('utf-8')
+            start = self._tail_start + len(self._tail)
+            self._tail += text
+            row['chunk_id'] = chunk['chunk_id']
+            row['doc'] = self._doc_rows[path]
+            row['chunk_index'] = chunk['chunk_index']
+            row['paragraph_start'] = -1 if chunk['paragraph_start'] is None else chunk['paragraph_start']
+            row['paragraph_end'] = -1 if chunk['paragraph_end'] is None else chunk['paragraph_end']
+            row['char_start'] = chunk['char_start']
+            row['char_end'] = chunk['char_end']
+            row['text_start'] = start
+            row['text_end'] = start + len(text)
+            row['content_hash'] = bytes.fromhex(chunk['content_hash'])
+            row['page_start'] = chunk.get('page_start') or -1
+            row['page_end'] = chunk.get('page_end') or -1
+        tags = np.fromiter((content_tags(chunk['content']) for chunk in chunks), dtype='uint8', count=len(chunks))
+        self.rows = np.concatenate([self.rows, rows])
+        self.tags = np.concatenate([self.tags, tags])
+
+    def remove_documents(self, file_paths: Iterable[str]) -> np.ndarray:
+        """删除文档及其片段，返回被删除的片段ID；文本字节在下次保存时回收"""
+        file_paths = set(file_paths)
+        removed = [row for row, path in enumerate(self._paths) if path in file_paths]
+        if not removed:
+            return np.zeros(0, dtype='int64')
+
+        remove_mask = np.isin(self.rows['doc'], removed)
+        removed_ids = np.array(self.rows['chunk_id'][remove_mask])
+        rows = self.rows[~remove_mask]
+        self.tags = self.tags[~remove_mask]
+
+        # 重新编号文档表，doc 列随之映射
+        keep_docs = np.ones(len(self._paths), dtype=bool)
+        keep_docs[removed] = False
+        doc_map = np.cumsum(keep_docs) - 1
+        rows['doc'] = doc_map[rows['doc']]
+        self.rows = rows
+        self._compact = True
+
+        for doc_row in removed:
+            self.documents.pop(self._paths[doc_row], None)
+        self._paths = [path for path, keep in zip(self._paths, keep_docs) if keep]
+        self._doc_rows = {path: row for row, path in enumerate(self._paths)}
+        return removed_ids
+
+    def get_chunk_ids(self, file_paths: Iterable[str]) -> List[int]:
+        """返回文档当前的全部片段ID"""
+        docs = [self._doc_rows[path] for path in file_paths if path in self._doc_rows]
+        if not docs:
+            return []
+        return self.rows['chunk_id'][np.isin(self.rows['doc'], docs)].tolist()
+
+    def select(self, spec: Dict[str, Any]) -> np.ndarray:
+        """满足筛选条件（normalize_filter 的结果）的片段行掩码"""
+        mask = np.ones(len(self.rows), dtype=bool)
+        bits = tag_mask(spec)
+        if bits:
+            mask &= (self.tags & bits) == bits
+        if any(field in spec for field in ('format_source', 'year', 'author')):
+            # 文档级条件逐文档判断一次，再按 doc 列展开到片段
+            doc_ok = np.fromiter((match_document(self.documents[path], spec) for path in self._paths),
+                                 dtype=bool, count=len(self._paths))
+            mask &= doc_ok[self.rows['doc']]
+        return mask
+
+    def position(self, chunk_id: int) -> Optional[int]:
+        """片段ID对应的行号，不存在时返回 None"""
+        ids = self.rows['chunk_id']
+        # 结构化数组的字段视图不连续，np.searchsorted 会先整列复制
+        pos = bisect.bisect_left(ids, chunk_id)
+        if pos < len(ids) and ids[pos] == chunk_id:
+            return pos
+        return None
+
+    def get(self, chunk_id: int) -> Dict[str, Any]:
+        """按片段ID读取片段"""
+        pos = self.position(chunk_id)
+        if pos is None:
+            raise KeyError(chunk_id)
+        return self.chunk_at(pos)
+
+    def chunk_at(self, pos: int) -> Dict[str, Any]:
+        """读取第 pos 行片段，返回与切分器输出相同结构的字典"""
+        row = self.rows[pos]
+        doc = self.documents[self._paths[row['doc']]]
+        paragraph_start = int(row['paragraph_start'])
+        paragraph_end = int(row['paragraph_end'])
+        chunk = {
+            "title": doc['title'],
+            "format_source": doc['format_source'],
+            "file_path": doc['file_path'],
+            "content": self._read_text(int(row['text_start']), int(row['text_end'])),
+            "chunk_index": int(row['chunk_index']),
+            "paragraph_start": None if paragraph_start < 0 else paragraph_start,
+            "paragraph_end": None if paragraph_end < 0 else paragraph_end,
+            "char_start": int(row['char_start']),
+            "char_end": int(row['char_end']),
+            "chunk_id": int(row['chunk_id']),
+            "content_hash": row['content_hash'].ljust(HASH_BYTES, b'\0').hex()
+        }
+        if row['page_start'] >= 0:
+            chunk["page_start"] = int(row['page_start'])
+            chunk["page_end"] = int(row['page_end'])
+        return chunk
+
+    def text_at(self, pos: int) -> str:
+        """只解码该片段的字节区间"""
+        row = self.rows[pos]
+        return self._read_text(int(row['text_start']), int(row['text_end']))
+
+    def _read_text(self, start: int, end: int) -> str:
+        if start >= self._tail_start:
+            return self._tail[start - self._tail_start:end - self._tail_start].decode('utf-8')
+        return str(memoryview(self._text)[start:end], 'utf-8')
+
+    def iter_chunks(self) -> Iterator[Dict[str, Any]]:
+        for pos in range(len(self.rows)):
+            yield self.chunk_at(pos)
+
+    def content_keys(self, positions: Any = slice(None)) -> List[bytes]:
+        """片段内容哈希（嵌入缓存键）"""
+        # 定长字节串列读取时会去掉末尾的 0 字节，需补齐
+        return [key.ljust(HASH_BYTES, b'\0') for key in self.rows['content_hash'][positions].tolist()]
+
+    def save(self, store_dir: str, meta: Dict[str, Any] = None):
+        """写入新一代数据文件，再原子替换 docstore.json 提交
+
+        没有删除片段时复制已有文本文件并追加新增文本，片段偏移不变；删除过
+        片段时按行顺序重写文本，回收已删除片段占用的字节。旧文件可能仍被其他
+        进程映射，因此不在原文件上追加。
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        generation = uuid.uuid4().hex[:12]
+        rows = np.array(self.rows)
+
+        text_path = os.path.join(store_dir, f"text.{generation}.bin")
+        if self._compact:
+            offset = self._write_compacted(text_path, rows)
+        else:
+            if self._tail_start:
+                shutil.copyfile(self._text_path, text_path)
+            with open(text_path, 'ab') as f:
+                f.write(self._tail)
+            offset = self._tail_start + len(self._tail)
+        np.save(os.path.join(store_dir, f"chunks.{generation}.npy"), rows)
+        np.save(os.path.join(store_dir, f"tags.{generation}.npy"), np.asarray(self.tags))
+
+        self.meta = dict(meta or {})
+        self._write_meta(store_dir, {
+            'format_version': FORMAT_VERSION,
+            'generation': generation,
+            'chunk_count': len(rows),
+            'text_bytes': offset,
+            'documents': [self.documents[path] for path in self._paths],
+            'index': self.meta
+        })
+
+        # 切换到新文件，旧文件仍被映射时（如 Windows）保留到下次保存再删除
+        self._open(store_dir, generation, len(rows))
+        for path in glob.glob(os.path.join(store_dir, "text.*.bin")) + \
+                glob.glob(os.path.join(store_dir, "chunks.*.npy")) + \
+                glob.glob(os.path.join(store_dir, "tags.*.npy")):
+            if generation not in os.path.basename(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _write_compacted(self, text_path: str, rows: np.ndarray) -> int:
+        """按行顺序重写文本并更新 rows 的偏移，返回文本总字节数"""
+        offset = 0
+        with open(text_path, 'wb') as f:
+            for pos in range(len(rows)):
+                start, end = int(rows['text_start'][pos]), int(rows['text_end'][pos])
+                if start >= self._tail_start:
+                    f.write(self._tail[start - self._tail_start:end - self._tail_start])
+                else:
+                    f.write(memoryview(self._text)[start:end])
+                rows['text_start'][pos] = offset
+                offset += end - start
+                rows['text_end'][pos] = offset
+        return offset
+
+    @classmethod
+    def load(cls, store_dir: str) -> "DocumentStore":
+        """加载存储，片段表和文本均以只读内存映射打开"""
+        with open(os.path.join(store_dir, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"文档存储格式版本不匹配: {meta.get('format_version')}")
+
+        store = cls()
+        store.meta = meta.get('index', {})
+        for doc in meta['documents']:
+            store._doc_rows[doc['file_path']] = len(store._paths)
+            store._paths.append(doc['file_path'])
+            store.documents[doc['file_path']] = doc
+        store._open(store_dir, meta['generation'], meta['chunk_count'])
+        if len(store._text) != meta['text_bytes']:
+            raise ValueError("文档存储文本文件不完整")
+        return store
+
+    @staticmethod
+    def exists(store_dir: str) -> bool:
+        return os.path.exists(os.path.join(store_dir, META_FILE))
+
+    def _open(self, store_dir: str, generation: str, count: int):
+        rows = np.load(os.path.join(store_dir, f"chunks.{generation}.npy"), mmap_mode='r')
+        if len(rows) != count or not set(rows.dtype.names) <= set(CHUNK_DTYPE.names):
+            raise ValueError("文档存储片段表不完整")
+        if rows.dtype != CHUNK_DTYPE:
+            # 早期存储缺少的列（如页码）补为 -1，下次保存时写入新格式
+            upgraded = np.full(count, -1, dtype=CHUNK_DTYPE)
+            for name in rows.dtype.names:
+                upgraded[name] = rows[name]
+            rows = upgraded
+        text_path = os.path.join(store_dir, f"text.{generation}.bin")
+        with open(text_path, 'rb') as f:
+            # 空文件无法映射
+            text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(text_path) else b''
+        # 去掉 memmap 子类，逐行访问时省去其额外开销，数据仍在映射中
+        self.rows = rows.view(np.ndarray)
+        self._text = text
+        self._tail = bytearray()
+        self._tail_start = len(text)
+        self._text_path = text_path
+        self._compact = False
+
+        tags_path = os.path.join(store_dir, f"tags.{generation}.npy")
+        if os.path.exists(tags_path):
+            self.tags = np.load(tags_path, mmap_mode='r').view(np.ndarray)
+        else:
+            # 早期存储没有标签列，从文本计算一次，下次保存时写入
+            self.tags = np.fromiter((content_tags(self.text_at(pos)) for pos in range(count)),
+                                    dtype='uint8', count=count)
+        if len(self.tags) != count:
+            raise ValueError("文档存储标签列不完整")
+
+    @staticmethod
+    def _write_meta(store_dir: str, meta: Dict[str, Any]):
+        path = os.path.join(store_dir, META_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -0,0 +1,112 @@
+import os
+import re
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from config.settings import settings
+
+# 规范化查询时去掉的首尾标点
+EDGE_PUNCTUATION = re.compile(r'^[\s?？!！。.,，;；:：]+|[\s?？!！。.,，;；:：]+$')
+
+
+class QueryEmbeddingCache:
+    """查询向量的LRU缓存，按规范化查询文本和模型ID索引，可选将淘汰项溢出到磁盘"""
+
+    def __init__(self, model_id: str, max_size: int = None, spill_dir: str = None):
+        self.model_id = model_id
+        self.max_size = max_size if max_size is not None else settings.QUERY_EMBEDDING_CACHE_SIZE
+        self.spill_dir = spill_dir
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.spill_dir and not os.path.exists(self.spill_dir):
+            os.makedirs(self.spill_dir)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """统一全半角、大小写和空白，去掉首尾标点"""
+        query = unicodedata.normalize('NFKC', query).lower()
+        query = re.sub(r'\s+', ' ', query)
+        return EDGE_PUNCTUATION.sub('', query)
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha1(f"{self.model_id}\0{self.normalize_query(query)}".encode('utf-8')).hexdigest()
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """查找查询向量，未命中返回 None"""
+        key = self._key(query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        embedding = self._load_spilled(key)
+        with self._lock:
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._store(key, embedding)
+        return embedding
+
+    def put(self, query: str, embedding: np.ndarray):
+        """写入查询向量"""
+        self._store(self._key(query), np.asarray(embedding, dtype='float32'))
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / total if total else 0.0
+            }
+
+    def _store(self, key: str, embedding: np.ndarray):
+        evicted = []
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.popitem(last=False))
+
+        for evicted_key, evicted_embedding in evicted:
+            self._spill(evicted_key, evicted_embedding)
+
+    def _spill(self, key: str, embedding: np.ndarray):
+        """将淘汰的向量写入磁盘"""
+        if not self.spill_dir:
+            return
+        path = os.path.join(self.spill_dir, f"{key}.npy")
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, embedding)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"查询向量溢出写入失败: {e}")
+
+    def _load_spilled(self, key: str) -> Optional[np.ndarray]:
+        if not self.spill_dir:
+            return None
+        path = os.path.join(self.spill_dir, f"{key}.npy")
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
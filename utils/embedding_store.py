@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+
+KEY_DTYPE = np.dtype('S20')
+
+
+class EmbeddingStore:
+    """按 (模型, 文本内容哈希) 持久化的向量库
+
+    向量按行追加写入 vectors.bin，通过内存映射读取；keys.bin 为与之逐行
+    对应的20字节SHA-1内容哈希；meta.json 记录维度、数据类型和已提交行数，
+    行数之后的未提交数据在下次写入前截断。
+    """
+
+    def __init__(self, model_id: str, store_dir: str = None, dtype: str = None):
+        self.model_id = model_id
+        self.store_dir = store_dir or os.path.join(settings.FAISS_INDEX_PATH, "embeddings", model_id)
+        self.dtype = np.dtype(dtype or settings.EMBEDDING_STORE_DTYPE)
+        self.dim = None
+        self.count = 0
+        self._rows: Dict[bytes, int] = {}
+        self._matrix = None
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.store_dir, "vectors.bin")
+
+    @property
+    def _keys_path(self) -> str:
+        return os.path.join(self.store_dir, "keys.bin")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.store_dir, "meta.json")
+
+    @staticmethod
+    def content_hash(text: str) -> bytes:
+        return hashlib.sha1(text.encode('utf-8')).digest()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._rows
+
+    def encode(self, texts: List[str],
+               encoder: Callable[[List[str]], np.ndarray]) -> Tuple[np.ndarray, List[bytes]]:
+        """返回文本向量及内容哈希，只对库中没有的文本调用 encoder"""
+        keys = [self.content_hash(text) for text in texts]
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+
+        if missing:
+            self._append(list(missing), encoder(list(missing.values())))
+        return self.get(keys), keys
+
+    def get(self, keys: List[bytes]) -> np.ndarray:
+        """按内容哈希读取向量（float32）"""
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype='float32')
+        rows = np.fromiter((self._rows[key] for key in keys), dtype='int64', count=len(keys))
+        return np.ascontiguousarray(self._matrix_view()[rows], dtype='float32')
+
+    def get_many(self, keys: List[bytes]) -> Optional[np.ndarray]:
+        """全部命中时返回向量，否则返回 None"""
+        if all(key in self._rows for key in keys):
+            return self.get(keys)
+        return None
+
+    def compact(self, live_keys: Iterable[bytes]) -> int:
+        """只保留仍被引用的向量，返回清理的行数"""
+        live_keys = [key for key in dict.fromkeys(live_keys) if key in self._rows]
+        removed = self.count - len(live_keys)
+        if removed <= 0:
+            return 0
+
+        vectors = np.array(self._matrix_view()[[self._rows[key] for key in live_keys]])
+        self._matrix = None
+        self._write_file(self._vectors_path, vectors.astype(self.dtype).tobytes())
+        self._write_file(self._keys_path, np.array(live_keys, dtype=KEY_DTYPE).tobytes())
+        self._rows = {key: row for row, key in enumerate(live_keys)}
+        self.count = len(live_keys)
+        self._write_meta()
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': self.count, 'hits': self.hits, 'misses': self.misses}
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.dim = meta['dim']
+            self.dtype = np.dtype(meta['dtype'])
+            self.count = meta['count']
+            keys = np.fromfile(self._keys_path, dtype=KEY_DTYPE, count=self.count)
+            if len(keys) != self.count:
+                raise ValueError("向量库键表不完整")
+            self._rows = {key: row for row, key in enumerate(keys.tolist())}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"向量库加载失败，将重新计算向量: {e}")
+            self.dim = None
+            self.count = 0
+            self._rows = {}
+
+    def _append(self, keys: List[bytes], vectors: np.ndarray):
+        """追加向量，写完数据后再更新 meta 中的提交行数"""
+        vectors = np.asarray(vectors)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self._matrix = None
+        row_bytes = self.dim * self.dtype.itemsize
+        for path, committed_size, data in (
+                (self._vectors_path, self.count * row_bytes, vectors.astype(self.dtype).tobytes()),
+                (self._keys_path, self.count * KEY_DTYPE.itemsize, np.array(keys, dtype=KEY_DTYPE).tobytes())):
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                # 丢弃上次中断写入留下的未提交数据
+                f.truncate(committed_size)
+                f.seek(committed_size)
+                f.write(data)
+
+        for offset, key in enumerate(keys):
+            self._rows[key] = self.count + offset
+        self.count += len(keys)
+        self._write_meta()
+
+    def _matrix_view(self) -> np.ndarray:
+        if self._matrix is None or len(self._matrix) != self.count:
+            if not self.count:
+                return np.zeros((0, self.dim or 0), dtype=self.dtype)
+            self._matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode='r',
+                                     shape=(self.count, self.dim))
+        return self._matrix
+
+    def _write_meta(self):
+        meta = {'model_id': self.model_id, 'dim': self.dim, 'dtype': self.dtype.name, 'count': self.count}
+        self._write_file(self._meta_path, json.dumps(meta).encode('utf-8'))
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
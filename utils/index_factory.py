@@ -0,0 +1,153 @@
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from config.settings import settings
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+
+# 自动选择索引类型的规模阈值
+FLAT_MAX_VECTORS = 100_000
+IVF_FLAT_MAX_VECTORS = 1_000_000
+# IVF-PQ 每个子量化器需要训练256个中心，样本过少时退回精确索引
+IVF_MIN_VECTORS = 10_000
+
+
+def choose_index_type(num_vectors: int, index_type: str = None) -> str:
+    """根据配置和向量数量确定索引类型，auto 时按规模选择"""
+    index_type = (index_type or settings.FAISS_INDEX_TYPE).lower()
+    if index_type != 'auto':
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}")
+        if index_type.startswith('ivf') and num_vectors < IVF_MIN_VECTORS:
+            return 'flat'
+        return index_type
+
+    if num_vectors < FLAT_MAX_VECTORS:
+        return 'flat'
+    if num_vectors < IVF_FLAT_MAX_VECTORS:
+        return 'ivf_flat'
+    return 'ivf_pq'
+
+
+def get_index_type(index: faiss.Index) -> str:
+    """识别已有索引的类型"""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(inner, faiss.IndexIVF):
+        return 'ivf_flat'
+    return 'flat'
+
+
+def build_index(index_type: str, dim: int, vectors: Optional[np.ndarray] = None) -> faiss.Index:
+    """创建支持自定义ID的内积索引，IVF 类索引用 vectors 的采样训练"""
+    if index_type == 'flat':
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    if index_type == 'hnsw':
+        hnsw = faiss.IndexHNSWFlat(dim, settings.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = max(settings.FAISS_EF_SEARCH, 2 * settings.FAISS_HNSW_M)
+        return faiss.IndexIDMap2(hnsw)
+
+    if vectors is None or not len(vectors):
+        raise ValueError(f"{index_type} 索引需要训练数据")
+
+    nlist = settings.FAISS_NLIST or _auto_nlist(len(vectors))
+    quantizer = faiss.IndexFlatIP(dim)
+    if index_type == 'ivf_flat':
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == 'ivf_pq':
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_subquantizers(dim), 8,
+                                 faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+
+    index.train(_training_sample(vectors))
+    # 哈希直接映射使 IVF 支持按ID重建和删除向量
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def configure_search(index: faiss.Index, nprobe: int = None, ef_search: int = None):
+    """设置查询期参数：IVF 的 nprobe、HNSW 的 efSearch"""
+    index_type = get_index_type(index)
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        faiss.extract_index_ivf(index).nprobe = nprobe or settings.FAISS_NPROBE
+    elif index_type == 'hnsw':
+        faiss.downcast_index(index.index).hnsw.efSearch = ef_search or settings.FAISS_EF_SEARCH
+
+
+def filtered_search_params(index: faiss.Index, ids: np.ndarray, nprobe: int = None,
+                           ef_search: int = None, effort: float = 1.0) -> faiss.SearchParameters:
+    """只在 ids 内检索的查询参数
+
+    IVF 和 HNSW 在筛选后可能凑不够 k 个结果，按 effort 倍数放大 nprobe / efSearch。
+    """
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype='int64'))
+    index_type = get_index_type(index)
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        ivf = faiss.extract_index_ivf(index)
+        params = faiss.SearchParametersIVF(
+            sel=selector, nprobe=min(ivf.nlist, int((nprobe or settings.FAISS_NPROBE) * effort)))
+    elif index_type == 'hnsw':
+        params = faiss.SearchParametersHNSW(sel=selector,
+                                            efSearch=int((ef_search or settings.FAISS_EF_SEARCH) * effort))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # 参数对象不持有选择器的引用，需保证其存活
+    params.referenced_objects = [selector]
+    return params
+
+
+def remove_ids(index: faiss.Index, remove: np.ndarray, keep: np.ndarray) -> faiss.Index:
+    """删除向量；HNSW 不支持删除，用保留的向量重建"""
+    if get_index_type(index) != 'hnsw':
+        index.remove_ids(remove)
+        return index
+
+    rebuilt = build_index('hnsw', index.d)
+    if len(keep):
+        rebuilt.add_with_ids(index.reconstruct_batch(keep), keep)
+    return rebuilt
+
+
+def convert_index(index: faiss.Index, index_type: str, ids: np.ndarray,
+                  vectors: Optional[np.ndarray] = None) -> faiss.Index:
+    """将向量迁移到另一种索引类型
+
+    未提供 vectors 时从原索引重建向量（IVF-PQ 为有损压缩，从其迁出会损失精度）。
+    """
+    if vectors is None:
+        vectors = index.reconstruct_batch(ids) if len(ids) else np.zeros((0, index.d), dtype='float32')
+    converted = build_index(index_type, index.d, vectors)
+    if len(ids):
+        converted.add_with_ids(vectors, ids)
+    return converted
+
+
+def _auto_nlist(num_vectors: int) -> int:
+    """聚类中心数取 4*sqrt(N)，并保证每个中心至少有39个训练样本"""
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """取不超过配置值且能整除维度的子量化器数量"""
+    m = min(settings.FAISS_PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _training_sample(vectors: np.ndarray) -> np.ndarray:
+    """随机采样训练数据"""
+    sample_size = settings.FAISS_TRAIN_SAMPLE
+    if len(vectors) <= sample_size:
+        return np.ascontiguousarray(vectors, dtype='float32')
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype='float32')
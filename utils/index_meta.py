@@ -0,0 +1,26 @@
+import os
+import json
+from typing import Any, Dict, Optional
+
+from config.settings import settings
+
+INDEX_META_FILE = "index_meta.json"
+
+
+def write_index_meta(meta: Dict[str, Any], index_dir: str = None):
+    """写入索引元数据（版本、片段数等），供无需加载索引的场景读取"""
+    path = os.path.join(index_dir or settings.FAISS_INDEX_PATH, INDEX_META_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_index_meta(index_dir: str = None) -> Optional[Dict[str, Any]]:
+    """读取索引元数据，不存在或损坏时返回 None"""
+    path = os.path.join(index_dir or settings.FAISS_INDEX_PATH, INDEX_META_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
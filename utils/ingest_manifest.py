@@ -0,0 +1,91 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Tuple
+
+from config.settings import settings
+
+
+def file_sha256(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """计算文件内容哈希"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_state(file_path: str) -> Dict[str, Any]:
+    """文件的大小、修改时间和内容哈希（清单条目）
+
+    先取大小和修改时间再计算哈希：之后文件若被修改，修改时间不同，下次增量
+    入库时会被发现。
+    """
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': file_sha256(file_path)}
+
+
+class IngestManifest:
+    """记录已入库文件的路径、大小、修改时间和内容哈希，用于增量索引"""
+
+    def __init__(self, manifest_path: str = None):
+        self.manifest_path = manifest_path or os.path.join(settings.FAISS_INDEX_PATH, "manifest.json")
+        self.entries: Dict[str, Dict[str, Any]] = {}
+
+    def load(self) -> bool:
+        """从文件加载清单"""
+        if not os.path.exists(self.manifest_path):
+            return False
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('files', {})
+            return True
+        except Exception as e:
+            print(f"清单加载失败: {e}")
+            self.entries = {}
+            return False
+
+    def save(self):
+        """原子地写入清单文件"""
+        directory = os.path.dirname(self.manifest_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def diff(self, file_paths: List[str]) -> Tuple[List[str], List[str], List[str], List[str]]:
+        """比较当前文件与清单，返回 (新增, 变更, 删除, 未变)"""
+        added, changed, unchanged = [], [], []
+        for file_path in file_paths:
+            entry = self.entries.get(file_path)
+            if entry is None:
+                added.append(file_path)
+                continue
+
+            stat = os.stat(file_path)
+            if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+                unchanged.append(file_path)
+            elif file_sha256(file_path) == entry['sha256']:
+                # 仅修改时间变化，内容未变
+                entry['mtime'] = stat.st_mtime
+                unchanged.append(file_path)
+            else:
+                changed.append(file_path)
+
+        current = set(file_paths)
+        removed = [path for path in self.entries if path not in current]
+        return added, changed, removed, unchanged
+
+    def update(self, file_path: str, state: Dict[str, Any] = None):
+        """记录文件状态；state 为解析时取得的 file_state，省去重复计算哈希"""
+        self.entries[file_path] = dict(state or file_state(file_path))
+
+    def remove(self, file_path: str):
+        """从清单中移除文件"""
+        self.entries.pop(file_path, None)
+
+    def clear(self):
+        self.entries = {}
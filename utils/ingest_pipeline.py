@@ -0,0 +1,205 @@
+import os
+import time
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from config.settings import settings
+from utils.ingest_manifest import file_state
+
+# 每个工作进程各自持有一个文档处理器
+_worker_processor = None
+
+
+def _init_worker(pool_size: int):
+    """工作进程初始化：记录进程池大小，OCR 按实际同时解析的文件数分配进程
+
+    每个工作进程自成一个进程组，其子进程（OCR进程池、caj2pdf、tesseract）
+    随之同组，终止时整组结束，不会遗留。
+    """
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    from utils.ocr import set_parallel_parsers
+    set_parallel_parsers(pool_size)
+
+
+def _process_file(file_path: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """工作进程入口：解析单个文件，返回 (文档, 文件状态)
+
+    文件哈希只计算一次，同时用于解析缓存、OCR缓存和入库清单。
+    """
+    global _worker_processor
+    if _worker_processor is None:
+        from utils.document_processor import DocumentProcessor
+        _worker_processor = DocumentProcessor()
+    state = file_state(file_path)
+    return _worker_processor.process_document(file_path, state['sha256']), state
+
+
+class IngestResult(NamedTuple):
+    file_path: str
+    document: Optional[Dict[str, Any]]
+    error: Optional[str]
+    elapsed: float
+    # 解析时取得的文件状态（大小、修改时间、哈希），供入库清单使用
+    file_state: Optional[Dict[str, Any]] = None
+
+
+class IngestProgress:
+    """文档解析进度与吞吐统计"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.bytes_processed = 0
+        self.start_time = time.monotonic()
+
+    def update(self, result: IngestResult):
+        """记录一个文件的结果并输出进度"""
+        self.completed += 1
+        if result.error:
+            self.failed += 1
+        else:
+            try:
+                self.bytes_processed += os.path.getsize(result.file_path)
+            except OSError:
+                pass
+
+        elapsed = time.monotonic() - self.start_time
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.completed) / rate if rate > 0 else 0.0
+        status = f"失败: {result.error}" if result.error else f"完成 {result.elapsed:.1f}s"
+        print(f"[{self.completed}/{self.total}] {os.path.basename(result.file_path)} {status} "
+              f"| {rate:.2f} 文件/秒，剩余约 {eta:.0f}s")
+
+    def summary(self):
+        """输出汇总统计"""
+        elapsed = time.monotonic() - self.start_time
+        succeeded = self.completed - self.failed
+        mb_per_sec = self.bytes_processed / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+        files_per_sec = self.completed / elapsed if elapsed > 0 else 0.0
+        print(f"解析完成: 成功 {succeeded}，失败 {self.failed}，用时 {elapsed:.1f}s，"
+              f"吞吐 {files_per_sec:.2f} 文件/秒 ({mb_per_sec:.2f} MB/s)")
+
+
+class ParallelIngestor:
+    """多进程文档解析：按完成顺序流式返回结果，单个文件的失败或超时不影响其他文件"""
+
+    def __init__(self, workers: int = None, timeout: float = None):
+        self.workers = max(1, workers or settings.INGEST_WORKERS)
+        # 不大于 0 表示不限时
+        self.timeout = timeout if timeout is not None else settings.INGEST_FILE_TIMEOUT
+
+    def iter_documents(self, file_paths: List[str]) -> Iterator[IngestResult]:
+        """解析文件，每完成一个即产出一个结果
+
+        设置了超时时即使只有一个进程或一个文件也在进程池中解析，卡住的解析
+        （如 caj2pdf、tesseract）超时后终止，不会阻塞整个入库。
+        """
+        if not file_paths:
+            return
+        if self.timeout <= 0 and (self.workers <= 1 or len(file_paths) <= 1):
+            yield from self._iter_serial(file_paths)
+            return
+
+        workers = min(self.workers, len(file_paths))
+
+        queue = deque(file_paths)
+        # 进程崩溃时在途的文件无法确定责任，之后逐个单独重试
+        suspects = deque()
+        isolated = None
+        running: Dict[Any, tuple] = {}
+        executor = self._create_pool(workers)
+
+        try:
+            while queue or suspects or running:
+                if suspects:
+                    if not running:
+                        isolated = suspects.popleft()
+                        future = executor.submit(_process_file, isolated)
+                        running[future] = (isolated, time.monotonic())
+                else:
+                    # 控制在途任务数不超过进程数，使提交时间近似于开始时间
+                    while queue and len(running) < workers:
+                        file_path = queue.popleft()
+                        future = executor.submit(_process_file, file_path)
+                        running[future] = (file_path, time.monotonic())
+
+                wait_timeout = None
+                if self.timeout > 0:
+                    deadline = min(start for _, start in running.values()) + self.timeout
+                    wait_timeout = max(0.0, deadline - time.monotonic())
+                done, _ = wait(running, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+                broken = False
+                for future in done:
+                    file_path, start = running.pop(future)
+                    elapsed = time.monotonic() - start
+                    try:
+                        document, state = future.result()
+                        result = IngestResult(file_path, document, None, elapsed, state)
+                    except BrokenProcessPool:
+                        # 工作进程崩溃（如OCR段错误）
+                        broken = True
+                        if file_path != isolated:
+                            suspects.append(file_path)
+                            continue
+                        result = IngestResult(file_path, None, "工作进程异常退出", elapsed)
+                    except Exception as e:
+                        result = IngestResult(file_path, None, str(e), elapsed)
+                    yield result
+                if not running:
+                    isolated = None
+
+                now = time.monotonic()
+                expired = [future for future, (_, start) in running.items()
+                           if 0 < self.timeout <= now - start]
+                for future in expired:
+                    file_path, start = running.pop(future)
+                    yield IngestResult(file_path, None, f"处理超时（{self.timeout:.0f}s）", now - start)
+
+                if expired or broken:
+                    # 卡住的任务无法单独取消，重建进程池，其余在途任务重新排队
+                    for file_path, _ in running.values():
+                        if broken:
+                            suspects.append(file_path)
+                        else:
+                            queue.appendleft(file_path)
+                    running.clear()
+                    isolated = None
+                    self._terminate(executor)
+                    executor = self._create_pool(workers)
+        finally:
+            self._terminate(executor)
+
+    def _iter_serial(self, file_paths: List[str]) -> Iterator[IngestResult]:
+        """未设置超时且只有一个进程或一个文件时在当前进程中解析"""
+        for file_path in file_paths:
+            start = time.monotonic()
+            try:
+                document, state = _process_file(file_path)
+                result = IngestResult(file_path, document, None, time.monotonic() - start, state)
+            except Exception as e:
+                result = IngestResult(file_path, None, str(e), time.monotonic() - start)
+            yield result
+
+    @staticmethod
+    def _create_pool(workers: int) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,))
+
+    def _terminate(self, executor: ProcessPoolExecutor):
+        """强制结束进程池，包括卡住的工作进程及其子进程"""
+        # ProcessPoolExecutor 没有公开终止单个工作进程的接口
+        for process in list((executor._processes or {}).values()):
+            if not process.is_alive():
+                continue
+            try:
+                # 工作进程的进程组ID即其PID（见 _init_worker）
+                os.killpg(process.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                # Windows 没有进程组；或工作进程尚未完成初始化
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,164 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config.settings import settings
+from utils.ingest_manifest import file_sha256
+
+
+def _init_ocr_worker():
+    # tesseract 默认按核数开线程，多进程并行时限制为单线程，避免互相争抢
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+
+def _ocr_page_range(pdf_path: str, first_page: int, last_page: int,
+                    dpi: int, lang: str) -> List[Tuple[int, str]]:
+    """工作进程入口：栅格化一段连续页面（页码从1开始）并逐页识别"""
+    import pdf2image
+    import pytesseract
+    images = pdf2image.convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+    results = []
+    for page, image in zip(range(first_page, last_page + 1), images):
+        results.append((page, pytesseract.image_to_string(image, lang=lang)))
+        image.close()
+    return results
+
+
+# 同时解析文件的进程数，由并行解析的工作进程初始化时设置；OCR 进程数按此分摊核数
+_parallel_parsers = 1
+
+
+def set_parallel_parsers(count: int):
+    global _parallel_parsers
+    _parallel_parsers = max(1, count)
+
+
+def default_ocr_workers() -> int:
+    """自动确定OCR进程数：CPU核数按同时解析文件的进程数分摊"""
+    if settings.OCR_WORKERS > 0:
+        return settings.OCR_WORKERS
+    return max(1, (os.cpu_count() or 1) // _parallel_parsers)
+
+
+class OCRPageCache:
+    """逐页OCR结果缓存，按 (文件内容哈希, 分辨率, 语言, 页码) 存为文本文件
+
+    文件改名或移动后仍可命中；中断的识别任务重新运行时只处理未缓存的页面。
+    """
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir or settings.OCR_CACHE_PATH
+
+    def _path(self, file_hash: str, variant: str, page: int) -> str:
+        return os.path.join(self.cache_dir, file_hash[:2], file_hash, variant, f"{page}.txt")
+
+    def get(self, file_hash: str, variant: str, page: int) -> Optional[str]:
+        try:
+            with open(self._path(file_hash, variant, page), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, file_hash: str, variant: str, page: int, text: str):
+        path = self._path(file_hash, variant, page)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+class PageOCR:
+    """扫描页OCR
+
+    只识别调用方指定的页面（通常是没有文字层的页面）。连续页面按 page_batch
+    页一段栅格化，分段提交到进程池识别，在途任务数不超过进程数的两倍，
+    内存占用与总页数无关。每页识别完成即写入缓存。
+    """
+
+    def __init__(self, workers: int = None, dpi: int = None, lang: str = None,
+                 page_batch: int = None, cache: OCRPageCache = None):
+        self.workers = workers or default_ocr_workers()
+        self.dpi = dpi or settings.OCR_DPI
+        self.lang = lang or settings.OCR_LANG
+        self.page_batch = max(1, page_batch or settings.OCR_PAGE_BATCH)
+        self.cache = cache or OCRPageCache()
+
+    @property
+    def variant(self) -> str:
+        return f"{self.dpi}-{self.lang}"
+
+    def ocr_pdf(self, pdf_path: str, pages: Iterable[int], file_hash: str = None) -> Dict[int, str]:
+        """识别PDF的指定页面（页码从1开始），返回 {页码: 文本}"""
+        file_hash = file_hash or file_sha256(pdf_path)
+        texts = {}
+        missing = []
+        for page in sorted(set(pages)):
+            cached = self.cache.get(file_hash, self.variant, page)
+            if cached is None:
+                missing.append(page)
+            else:
+                texts[page] = cached
+
+        for page, text in self._run(pdf_path, self._page_ranges(missing)):
+            self.cache.put(file_hash, self.variant, page, text)
+            texts[page] = text
+        return texts
+
+    def ocr_image(self, image_path: str, file_hash: str = None) -> str:
+        """识别单张图片"""
+        file_hash = file_hash or file_sha256(image_path)
+        cached = self.cache.get(file_hash, self.variant, 1)
+        if cached is not None:
+            return cached
+
+        import pytesseract
+        from PIL import Image
+        with Image.open(image_path) as image:
+            text = pytesseract.image_to_string(image, lang=self.lang)
+        self.cache.put(file_hash, self.variant, 1, text)
+        return text
+
+    def _page_ranges(self, pages: List[int]) -> List[Tuple[int, int]]:
+        """将有序页码合并为不超过 page_batch 页的连续区间"""
+        ranges = []
+        for page in pages:
+            if ranges and page == ranges[-1][1] + 1 and page - ranges[-1][0] < self.page_batch:
+                ranges[-1] = (ranges[-1][0], page)
+            else:
+                ranges.append((page, page))
+        return ranges
+
+    def _run(self, pdf_path: str, ranges: List[Tuple[int, int]]) -> Iterator[Tuple[int, str]]:
+        """识别各页段，按完成顺序产出 (页码, 文本)；单个页段失败时跳过"""
+        if not ranges:
+            return
+        # Python 3.8 的进程池工作进程为守护进程，不能再创建子进程
+        if self.workers <= 1 or len(ranges) == 1 or multiprocessing.current_process().daemon:
+            for first_page, last_page in ranges:
+                yield from self._run_range(pdf_path, first_page, last_page)
+            return
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(ranges)),
+                                 initializer=_init_ocr_worker) as executor:
+            pending = list(reversed(ranges))
+            running = {}
+            while pending or running:
+                while pending and len(running) < 2 * self.workers:
+                    first_page, last_page = pending.pop()
+                    future = executor.submit(_ocr_page_range, pdf_path, first_page, last_page, self.dpi, self.lang)
+                    running[future] = (first_page, last_page)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    first_page, last_page = running.pop(future)
+                    try:
+                        yield from future.result()
+                    except Exception as e:
+                        print(f"OCR处理失败（第{first_page}-{last_page}页）: {e}")
+
+    def _run_range(self, pdf_path: str, first_page: int, last_page: int) -> Iterator[Tuple[int, str]]:
+        try:
+            yield from _ocr_page_range(pdf_path, first_page, last_page, self.dpi, self.lang)
+        except Exception as e:
+            print(f"OCR处理失败（第{first_page}-{last_page}页）: {e}")
@@ -0,0 +1,113 @@
+import os
+import json
+import gzip
+import shutil
+import zlib
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from config.settings import settings
+
+# 缓存文件格式版本，结构变化时递增
+FORMAT_VERSION = 2
+
+
+def remove_unreferenced(cache_dir: str, live_hashes: Iterable[str]) -> int:
+    """删除按 <哈希前两位>/<文件哈希>/ 存放、且哈希不在 live_hashes 中的缓存目录，返回删除数量"""
+    live_hashes = set(live_hashes)
+    removed = 0
+    if not os.path.isdir(cache_dir):
+        return 0
+    for prefix in os.listdir(cache_dir):
+        prefix_dir = os.path.join(cache_dir, prefix)
+        if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+            continue
+        for file_hash in os.listdir(prefix_dir):
+            if file_hash not in live_hashes:
+                shutil.rmtree(os.path.join(prefix_dir, file_hash), ignore_errors=True)
+                removed += 1
+        try:
+            os.rmdir(prefix_dir)
+        except OSError:
+            # 目录非空
+            pass
+    return removed
+
+
+class CachedDocument(NamedTuple):
+    document: Dict[str, Any]
+    # 标题取自文件名（而非 ENW/RIS 等记录中的标题），命中时按当前文件名更新
+    title_from_filename: bool
+
+
+class ParseCache:
+    """文档解析结果缓存，按 (文件内容哈希, 解析键) 存放
+
+    解析键由扩展名、解析器版本和影响解析结果的配置组成（见
+    DocumentProcessor.cache_key），解析逻辑或配置变化后旧条目自动失效。
+    条目为紧凑 JSON 的 gzip 压缩，记录格式版本、文件哈希和解析键，读取时
+    校验（gzip 自带 CRC），损坏或不匹配的条目视为未命中并删除。
+    """
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir or settings.PARSE_CACHE_PATH
+
+    def _path(self, file_hash: str, key: str) -> str:
+        return os.path.join(self.cache_dir, file_hash[:2], file_hash, f"{key}.json.gz")
+
+    def get(self, file_hash: str, key: str) -> Optional[CachedDocument]:
+        """读取解析结果，未命中返回 None"""
+        path = self._path(file_hash, key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(gzip.decompress(f.read()).decode('utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, zlib.error, ValueError) as e:
+            print(f"解析缓存损坏，重新解析: {e}")
+            self._discard(path)
+            return None
+
+        if (not isinstance(entry, dict) or entry.get('format_version') != FORMAT_VERSION
+                or entry.get('file_hash') != file_hash or entry.get('key') != key
+                or not isinstance(entry.get('document'), dict)):
+            self._discard(path)
+            return None
+        return CachedDocument(entry['document'], bool(entry.get('title_from_filename')))
+
+    def put(self, file_hash: str, key: str, document: Dict[str, Any], title_from_filename: bool = False):
+        """原子写入解析结果"""
+        path = self._path(file_hash, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {'format_version': FORMAT_VERSION, 'file_hash': file_hash, 'key': key,
+                 'title_from_filename': title_from_filename, 'document': document}
+        data = gzip.compress(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                             compresslevel=6, mtime=0)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def gc(self, live_hashes: Iterable[str], live_keys: Iterable[str] = None) -> int:
+        """删除不在 live_hashes 中的文件的条目；给出 live_keys 时同时删除其余解析键（旧版本）的条目"""
+        live_hashes = set(live_hashes)
+        removed = remove_unreferenced(self.cache_dir, live_hashes)
+        if live_keys is None:
+            return removed
+
+        live_names = {f"{key}.json.gz" for key in live_keys}
+        for file_hash in live_hashes:
+            entry_dir = os.path.join(self.cache_dir, file_hash[:2], file_hash)
+            if not os.path.isdir(entry_dir):
+                continue
+            for name in os.listdir(entry_dir):
+                if name not in live_names:
+                    self._discard(os.path.join(entry_dir, name))
+                    removed += 1
+        return removed
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
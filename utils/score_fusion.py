@@ -0,0 +1,69 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import settings
+
+FUSION_METHODS = ('rrf', 'minmax', 'zscore')
+
+
+def min_max_normalize(scores: np.ndarray) -> np.ndarray:
+    """线性缩放到 [0, 1]，得分全部相同时均记为 1"""
+    scores = np.asarray(scores, dtype='float64')
+    if not len(scores):
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low < 1e-12:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def z_score_normalize(scores: np.ndarray) -> np.ndarray:
+    """标准化为均值0、标准差1，得分全部相同时均记为 0"""
+    scores = np.asarray(scores, dtype='float64')
+    if not len(scores):
+        return scores
+    std = scores.std()
+    if std < 1e-12:
+        return np.zeros_like(scores)
+    return (scores - scores.mean()) / std
+
+
+def fuse_scores(ranked_lists: Sequence[Tuple[Sequence[int], Sequence[float]]],
+                weights: Sequence[float] = None,
+                method: str = None,
+                rrf_k: int = None) -> List[Tuple[int, float]]:
+    """融合多路检索结果，返回按融合得分降序的 (ID, 得分)
+
+    ranked_lists 中每一路为 (按得分降序的ID, 对应得分)。
+    rrf: 按名次计分 w / (rrf_k + rank)，与各路得分尺度无关；
+    minmax / zscore: 先对每一路得分归一化再加权求和，某一路未召回的ID记为该路最低分。
+    """
+    method = (method or settings.FUSION_METHOD).lower()
+    if weights is None:
+        weights = [1.0] * len(ranked_lists)
+    rrf_k = rrf_k or settings.RRF_K
+
+    if method not in FUSION_METHODS:
+        raise ValueError(f"不支持的融合方法: {method}")
+
+    ranked_lists = [([int(doc_id) for doc_id in ids], scores) for ids, scores in ranked_lists]
+    all_ids = {doc_id for ids, _ in ranked_lists for doc_id in ids}
+    fused = dict.fromkeys(all_ids, 0.0)
+
+    for (ids, scores), weight in zip(ranked_lists, weights):
+        if not ids:
+            continue
+
+        if method == 'rrf':
+            for rank, doc_id in enumerate(ids, start=1):
+                fused[doc_id] += weight / (rrf_k + rank)
+            continue
+
+        normalized = min_max_normalize(scores) if method == 'minmax' else z_score_normalize(scores)
+        floor = float(normalized.min())
+        contributions = dict(zip(ids, normalized.tolist()))
+        for doc_id in all_ids:
+            fused[doc_id] += weight * contributions.get(doc_id, floor)
+
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,148 @@
+import re
+import json
+from typing import Any, Dict, List, Optional
+
+# 片段内容标签及其位标记，入库时按格式标签计算
+TAG_BITS = {'表格': 1, '公式': 2}
+TAG_MARKERS = {'表格': '【表格】', '公式': '【公式】'}
+
+FILTER_FIELDS = ('tags', 'format_source', 'year', 'author')
+
+YEAR_PATTERN = re.compile(r'(?<!\d)(1[5-9]\d{2}|20\d{2})(?!\d)')
+
+# 参考文献中记录年份和作者的字段（ENW 为单字母字段，RIS 为 rispy 字段名）
+YEAR_FIELDS = ('D', 'Y', 'year', 'publication_year', 'date')
+AUTHOR_FIELDS = ('A', 'authors', 'first_authors')
+
+
+def content_tags(text: str) -> int:
+    """片段包含的格式标签位"""
+    bits = 0
+    for tag, marker in TAG_MARKERS.items():
+        if marker in text:
+            bits |= TAG_BITS[tag]
+    return bits
+
+
+def extract_facets(structured_info: Dict[str, Any]) -> Dict[str, Any]:
+    """从文档结构化信息中提取年份和作者"""
+    year = None
+    for field in YEAR_FIELDS:
+        match = YEAR_PATTERN.search(str(structured_info.get(field) or ''))
+        if match:
+            year = int(match.group(1))
+            break
+
+    authors = []
+    for field in AUTHOR_FIELDS:
+        value = structured_info.get(field)
+        if isinstance(value, str):
+            value = [value]
+        for author in value or []:
+            author = str(author).strip()
+            if author and author not in authors:
+                authors.append(author)
+    return {'year': year, 'authors': authors}
+
+
+def normalize_filter(content_filter: Any) -> Optional[Dict[str, Any]]:
+    """将筛选条件规范化为字典，无筛选时返回 None
+
+    字符串为内容标签（"表格"、"含表格"、"公式"、"含公式"，"全部" 表示不筛选）；
+    字典可包含 tag/tags（标签，多个时需同时包含）、format_source（格式，可为列表）、
+    year（年份或 [起, 止]）和 author（作者名，不区分大小写的包含匹配）。
+    条件不合法时抛出 ValueError。
+    """
+    if content_filter is None or content_filter in ('', '全部'):
+        return None
+    if isinstance(content_filter, str):
+        content_filter = {'tags': [content_filter]}
+    if not isinstance(content_filter, dict):
+        raise ValueError(f"不支持的筛选条件: {content_filter!r}")
+
+    content_filter = dict(content_filter)
+    tags = _as_list(content_filter.pop('tag', None)) + _as_list(content_filter.get('tags'))
+    unknown = set(content_filter) - set(FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f"不支持的筛选字段: {', '.join(sorted(unknown))}")
+
+    spec = {}
+    tags = sorted({str(tag).strip().lstrip('含') for tag in tags})
+    for tag in tags:
+        if tag not in TAG_BITS:
+            raise ValueError(f"不支持的内容标签: {tag}（可选 {'、'.join(TAG_BITS)}）")
+    if tags:
+        spec['tags'] = tags
+
+    formats = sorted({str(fmt).strip().lstrip('.').upper() for fmt in _as_list(content_filter.get('format_source'))})
+    if formats:
+        spec['format_source'] = formats
+
+    year = content_filter.get('year')
+    if year not in (None, ''):
+        try:
+            if isinstance(year, (list, tuple)):
+                if len(year) != 2:
+                    raise ValueError
+                low, high = (int(value) if value not in (None, '') else None for value in year)
+            else:
+                low = high = int(year)
+        except (TypeError, ValueError):
+            raise ValueError(f"year 应为年份或 [起, 止]: {year!r}")
+        spec['year'] = [low, high]
+
+    author = str(content_filter.get('author') or '').strip().lower()
+    if author:
+        spec['author'] = author
+
+    return spec or None
+
+
+def parse_year_range(text: str) -> List[Optional[int]]:
+    """解析命令行年份条件："2020"、"2018-2022"、"2018-"（起始年份之后）"""
+    low, sep, high = str(text).partition('-')
+    try:
+        low = int(low) if low.strip() else None
+        high = (int(high) if high.strip() else None) if sep else low
+    except ValueError:
+        raise ValueError(f"年份格式应为 2020 或 2018-2022: {text}")
+    return [low, high]
+
+
+def filter_key(content_filter: Any) -> str:
+    """规范化后的筛选条件的字符串键，用于缓存和分组"""
+    return json.dumps(normalize_filter(content_filter), sort_keys=True, ensure_ascii=False)
+
+
+def tag_mask(spec: Dict[str, Any]) -> int:
+    bits = 0
+    for tag in spec.get('tags', []):
+        bits |= TAG_BITS[tag]
+    return bits
+
+
+def match_document(doc: Dict[str, Any], spec: Dict[str, Any]) -> bool:
+    """文档级条件（格式、年份、作者）是否满足"""
+    if 'format_source' in spec and doc.get('format_source', '').upper() not in spec['format_source']:
+        return False
+    if 'year' not in spec and 'author' not in spec:
+        return True
+
+    facets = doc if 'year' in doc else extract_facets(doc.get('structured_info') or {})
+    if 'year' in spec:
+        low, high = spec['year']
+        year = facets.get('year')
+        if year is None or (low is not None and year < low) or (high is not None and year > high):
+            return False
+    if 'author' in spec:
+        if not any(spec['author'] in author.lower() for author in facets.get('authors', [])):
+            return False
+    return True
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
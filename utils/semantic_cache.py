@@ -0,0 +1,155 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from config.settings import settings
+from utils.cache_manager import CacheManager
+
+# 最近邻相似度直方图的分桶边界，用于调整命中阈值
+SIMILARITY_BINS = np.linspace(0.0, 1.0, 21)
+
+
+class SemanticQuestionCache:
+    """语义问题缓存
+
+    以归一化的问题向量建立内积索引，新问题与已缓存问题的相似度不低于阈值、
+    筛选条件相同且本次检索到的来源片段与缓存回答引用的片段一致时，直接复用
+    缓存回答。回答本身及其失效规则由 CacheManager 管理，这里只保存问题向量
+    到缓存键的索引；缓存键已失效的向量在查找时顺带移除。
+    """
+
+    def __init__(self, cache_manager: CacheManager, model_id: str,
+                 threshold: float = None, candidates: int = None):
+        self.cache_manager = cache_manager
+        self.model_id = model_id
+        self.threshold = threshold if threshold is not None else settings.SEMANTIC_CACHE_THRESHOLD
+        self.candidates = candidates or settings.SEMANTIC_CACHE_CANDIDATES
+        self.index = None
+        # 向量ID -> (缓存键, 筛选条件)
+        self._entries: Dict[int, tuple] = {}
+        self._ids_by_key: Dict[str, int] = {}
+        self._next_id = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.source_mismatches = 0
+        self.hit_similarities: List[float] = []
+        self.best_similarity_counts = np.zeros(len(SIMILARITY_BINS) - 1, dtype='int64')
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CACHE_ENABLED and settings.SEMANTIC_CACHE_ENABLED
+
+    def lookup(self, embedding: np.ndarray, filters: Dict[str, Any], epoch: str,
+               source_ids: List[int]) -> Optional[Dict[str, Any]]:
+        """查找语义相近且来源一致的缓存回答，未命中返回 None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            self._ensure_loaded()
+            self.lookups += 1
+            if self.index is None or not self.index.ntotal:
+                return None
+            similarities, ids = self.index.search(self._as_query(embedding),
+                                                  min(self.candidates, self.index.ntotal))
+            self.best_similarity_counts += np.histogram(
+                np.clip(similarities[0, :1], 0.0, 1.0), bins=SIMILARITY_BINS)[0]
+            candidates = [(float(similarity), self._entries[vector_id])
+                          for similarity, vector_id in zip(similarities[0], ids[0])
+                          if vector_id >= 0 and similarity >= self.threshold]
+
+        filters_key = self.cache_manager.serialize_filters(filters)
+        sources = set(int(chunk_id) for chunk_id in source_ids)
+        stale_keys = []
+        result = None
+        for similarity, (cache_key, entry_filters) in candidates:
+            if entry_filters != filters_key:
+                continue
+            cached = self.cache_manager.get_by_key(cache_key, epoch)
+            if cached is None:
+                stale_keys.append(cache_key)
+                continue
+            if {int(source[0]) for source in cached.get('sources', [])} != sources:
+                with self._lock:
+                    self.source_mismatches += 1
+                continue
+            result = cached
+            with self._lock:
+                self.hits += 1
+                self.hit_similarities.append(similarity)
+            break
+
+        if stale_keys:
+            with self._lock:
+                self._remove_keys(stale_keys)
+        return result
+
+    def add(self, query: str, filters: Dict[str, Any], embedding: np.ndarray):
+        """为刚写入 CacheManager 的回答登记问题向量"""
+        if not self.enabled:
+            return
+        cache_key = self.cache_manager.set_question_embedding(query, filters, self.model_id, embedding)
+        if cache_key is None:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            self._add_vectors([cache_key], [self.cache_manager.serialize_filters(filters)],
+                              self._as_query(embedding))
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率及最近邻相似度分布"""
+        with self._lock:
+            histogram = {
+                f"{low:.2f}-{high:.2f}": int(count)
+                for low, high, count in zip(SIMILARITY_BINS[:-1], SIMILARITY_BINS[1:],
+                                            self.best_similarity_counts)
+                if count
+            }
+            return {
+                'size': self.index.ntotal if self.index is not None else 0,
+                'threshold': self.threshold,
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'source_mismatches': self.source_mismatches,
+                'mean_hit_similarity': float(np.mean(self.hit_similarities)) if self.hit_similarities else None,
+                'best_similarity_histogram': histogram
+            }
+
+    def _ensure_loaded(self):
+        """首次使用时从缓存库重建问题向量索引"""
+        if self._loaded:
+            return
+        self._loaded = True
+        rows = self.cache_manager.load_question_embeddings(self.model_id)
+        if rows:
+            keys, filters, vectors = zip(*rows)
+            self._add_vectors(list(keys), list(filters), np.vstack(vectors))
+
+    def _add_vectors(self, keys: List[str], filters: List[str], vectors: np.ndarray):
+        self._remove_keys([key for key in keys if key in self._ids_by_key])
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        ids = np.arange(self._next_id, self._next_id + len(keys), dtype='int64')
+        self._next_id += len(keys)
+        self.index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), ids)
+        for vector_id, key, entry_filters in zip(ids.tolist(), keys, filters):
+            self._entries[vector_id] = (key, entry_filters)
+            self._ids_by_key[key] = vector_id
+
+    def _remove_keys(self, keys: List[str]):
+        ids = [self._ids_by_key.pop(key) for key in set(keys) if key in self._ids_by_key]
+        if not ids:
+            return
+        for vector_id in ids:
+            self._entries.pop(vector_id, None)
+        self.index.remove_ids(np.array(ids, dtype='int64'))
+
+    @staticmethod
+    def _as_query(embedding: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(embedding, dtype='float32').reshape(1, -1)
@@ -0,0 +1,109 @@
+import re
+from typing import List
+
+from config.settings import settings
+
+# 中日韩统一表意文字连续片段，或拉丁字母/数字组成的词
+TOKEN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+(?:[._-][a-z0-9]+)*')
+CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+STOPWORDS_ZH = {
+    '的', '了', '是', '在', '和', '与', '及', '或', '等', '对', '中', '为', '将', '把', '被',
+    '也', '都', '而', '并', '就', '但', '之', '其', '这', '那', '有', '个', '们', '以', '于',
+    '哪些', '什么', '如何', '怎么', '怎样', '为什么', '是否', '可以', '一个', '一种', '我们', '他们'
+}
+
+STOPWORDS_EN = {
+    'a', 'an', 'the', 'of', 'to', 'in', 'on', 'for', 'and', 'or', 'is', 'are', 'was', 'were',
+    'be', 'by', 'with', 'as', 'at', 'from', 'that', 'this', 'it', 'its', 'what', 'which', 'how'
+}
+
+# 单字停用词用于切断中文片段，避免生成跨越虚词的 n-gram
+STOPCHARS_ZH = {word for word in STOPWORDS_ZH if len(word) == 1}
+
+
+class BaseTokenizer:
+    """BM25 分词器基类"""
+
+    name = "base"
+
+    def tokenize(self, text: str) -> List[str]:
+        raise NotImplementedError
+
+
+class WhitespaceTokenizer(BaseTokenizer):
+    """按空白切分，仅适用于英文语料"""
+
+    name = "whitespace"
+
+    def tokenize(self, text: str) -> List[str]:
+        return text.lower().split()
+
+
+class NGramTokenizer(BaseTokenizer):
+    """中英混合分词：中文按字 n-gram，英文和数字按词，去除停用词"""
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        self.name = f"ngram{n}"
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for match in TOKEN_PATTERN.finditer(text.lower()):
+            run = match.group()
+            if CJK_PATTERN.match(run):
+                tokens.extend(self._cjk_ngrams(run))
+            elif run not in STOPWORDS_EN:
+                tokens.append(run)
+        return tokens
+
+    def _cjk_ngrams(self, run: str) -> List[str]:
+        """在单字停用词处切断后生成 n-gram，不足 n 字的片段整体保留"""
+        tokens = []
+        start = 0
+        for i in range(len(run) + 1):
+            if i == len(run) or run[i] in STOPCHARS_ZH:
+                segment = run[start:i]
+                if len(segment) <= self.n:
+                    if segment and segment not in STOPWORDS_ZH:
+                        tokens.append(segment)
+                else:
+                    grams = (segment[j:j + self.n] for j in range(len(segment) - self.n + 1))
+                    tokens.extend(gram for gram in grams if gram not in STOPWORDS_ZH)
+                start = i + 1
+        return tokens
+
+
+class JiebaTokenizer(BaseTokenizer):
+    """基于 jieba 搜索引擎模式的中文分词（需要安装 jieba）"""
+
+    name = "jieba"
+
+    def __init__(self):
+        try:
+            import jieba
+        except ImportError:
+            raise ImportError("使用 jieba 分词需要先安装: pip install jieba")
+        self._jieba = jieba
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = []
+        for word in self._jieba.lcut_for_search(text.lower()):
+            word = word.strip()
+            if not word or word in STOPWORDS_ZH or word in STOPWORDS_EN:
+                continue
+            if TOKEN_PATTERN.fullmatch(word):
+                tokens.append(word)
+        return tokens
+
+
+def get_tokenizer(name: str = None) -> BaseTokenizer:
+    """按名称创建分词器，默认使用 settings.BM25_TOKENIZER"""
+    name = (name or settings.BM25_TOKENIZER).lower()
+    if name == "whitespace":
+        return WhitespaceTokenizer()
+    if name == "jieba":
+        return JiebaTokenizer()
+    if name.startswith("ngram"):
+        return NGramTokenizer(int(name[5:] or 2))
+    raise ValueError(f"不支持的分词器: {name}")
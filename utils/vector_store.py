@@ -1,131 +1,444 @@
 import os
+import uuid
+import threading
 import json
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
+from functools import lru_cache
 from typing import List, Dict, Any, Tuple
-import pickle
 
 from config.settings import settings
+from utils.chunker import TextChunker
+from utils.bm25_index import BM25Index
+from utils.tokenizer import get_tokenizer
+from utils.score_fusion import fuse_scores
+from utils.embedding_cache import QueryEmbeddingCache
+from utils.embedding_store import EmbeddingStore
+from utils.document_store import DocumentStore
+from utils.search_filter import extract_facets, normalize_filter
+from utils.index_meta import read_index_meta, write_index_meta
+from utils.index_factory import (
+    build_index, choose_index_type, configure_search, convert_index, filtered_search_params,
+    get_index_type, remove_ids
+)
+
+
+# 索引格式版本：2 为片段级、L2归一化向量
+INDEX_FORMAT_VERSION = 2
+
+# 缓存的筛选条件数量上限
+FILTER_CACHE_SIZE = 64
+
+# 分词器不支持多线程同时编码；热加载后新旧索引共用同一模型，锁放在模块级
+ENCODE_LOCK = threading.Lock()
 
 
 class VectorStore:
-    def __init__(self):
-        self.model = SentenceTransformer(settings.LOCAL_MODEL_PATH)
+    def __init__(self, model=None):
+        # 模型在首次编码时才加载（导入 torch 较慢）；热加载索引时复用已加载的模型
+        self._model = model
+        self.model_id = os.path.basename(os.path.normpath(settings.LOCAL_MODEL_PATH))
+        spill_dir = os.path.join(settings.FAISS_INDEX_PATH, "query_embeddings") \
+            if settings.QUERY_EMBEDDING_SPILL else None
+        self.query_cache = QueryEmbeddingCache(self.model_id, spill_dir=spill_dir)
+        # 片段向量按内容哈希持久化，重建索引时只编码新文本
+        self.embedding_store = EmbeddingStore(self.model_id)
+        self.chunker = TextChunker()
+        self.tokenizer = get_tokenizer()
+        # 查询分词结果缓存，重复提问时无需再次分词
+        self._tokenize_query = lru_cache(maxsize=1024)(lambda text: tuple(self._tokenize(text)))
         self.index = None
-        self.documents = []
-        self.bm25_index = None
-        self.doc_id_to_index = {}
+        # 检索单元为片段；片段文本和元数据存于列式存储，加载时内存映射
+        self.doc_store = DocumentStore()
+        self.bm25_index = BM25Index(tokenizer=self.tokenizer.name)
+        self.next_id = 0
+        # 索引版本，全量重建时更新，回答缓存据此判断条目是否仍然有效
+        self.index_epoch = uuid.uuid4().hex
+        # 查询期近似检索参数，None 表示使用配置默认值
+        self.nprobe = None
+        self.ef_search = None
+        # 筛选条件 -> 允许的片段ID、BM25槽位掩码和FAISS查询参数（或精确检索用的
+        # 片段向量），索引变化时清空；检索可能在多个线程中进行，读写时加锁
+        self._selections = {}
+        self._selections_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(settings.LOCAL_MODEL_PATH)
+        return self._model
+
+    @property
+    def chunk_ids(self) -> np.ndarray:
+        return self.doc_store.chunk_ids
+
+    @property
+    def documents(self) -> Dict[str, Dict[str, Any]]:
+        """父文档元数据，按文件路径索引"""
+        return self.doc_store.documents
 
     def create_index(self, documents: List[Dict[str, Any]]):
         """创建FAISS索引和BM25索引"""
-        self.documents = documents
+        self.reset()
+        self.add_documents(documents)
+
+    def reset(self):
+        """清空索引，保留ID计数器以避免ID复用"""
+        self.index = None
+        self.doc_store = DocumentStore()
+        self.bm25_index = BM25Index(tokenizer=self.tokenizer.name)
+        self.index_epoch = uuid.uuid4().hex
+        self._selections = {}
+
+    def add_documents(self, documents: List[Dict[str, Any]], save: bool = True):
+        """将文档切分为片段并追加到现有索引"""
+        if documents:
+            chunks = []
+            doc_chunks = []
+            for doc in documents:
+                doc_chunks.append(self.chunker.chunk_document(doc))
+                chunks.extend(doc_chunks[-1])
 
-        # 准备文本用于嵌入
-        texts = []
-        for doc in documents:
-            # 组合标题和内容进行嵌入
-            text = f"{doc['title']} {doc['content']}"
-            texts.append(text)
+            # 准备文本用于嵌入
+            texts = [self._chunk_text(chunk) for chunk in chunks]
+            ids = np.arange(self.next_id, self.next_id + len(chunks), dtype='int64')
+            self.next_id += len(chunks)
 
-            # 存储文档ID到索引的映射
-            doc_id = len(self.documents) - 1
-            self.doc_id_to_index[doc['file_path']] = doc_id
+            # 嵌入并写入ID映射的FAISS索引
+            embeddings, content_keys = self.embedding_store.encode(texts, self._encode)
+            if self.index is None:
+                # 入库阶段先写入精确索引，保存时再按规模转换为近似索引
+                self.index = build_index('flat', embeddings.shape[1])
+            self.index.add_with_ids(embeddings, ids)
 
-        # 创建FAISS索引
-        embeddings = self.model.encode(texts, convert_to_numpy=True)
-        self.index = faiss.IndexFlatIP(embeddings.shape[1])
-        self.index.add(embeddings.astype('float32'))
+            for chunk_id, chunk, content_key in zip(ids.tolist(), chunks, content_keys):
+                chunk['chunk_id'] = chunk_id
+                chunk['content_hash'] = content_key.hex()
+            for doc, doc_chunk_list in zip(documents, doc_chunks):
+                self.doc_store.add_document({
+                    "title": doc['title'],
+                    "format_source": doc['format_source'],
+                    "file_path": doc['file_path'],
+                    "structured_info": doc.get('structured_info', {}),
+                    "paragraph_count": len(doc.get('paragraphs', [])),
+                    "chunk_count": len(doc_chunk_list),
+                    "page_count": doc.get('page_count'),
+                    # 年份、作者供检索筛选
+                    **extract_facets(doc.get('structured_info') or {})
+                }, doc_chunk_list)
 
-        # 创建BM25索引
-        tokenized_texts = [self._tokenize(text) for text in texts]
-        self.bm25_index = BM25Okapi(tokenized_texts)
+            # 增量写入BM25倒排表
+            self.bm25_index.add_documents(ids.tolist(), [self._tokenize(text) for text in texts])
+            self._selections = {}
 
-        # 保存索引
-        self._save_index()
+        if save and self.index is not None:
+            self._save_index()
+
+    def get_chunk_ids(self, file_paths: List[str]) -> List[int]:
+        """返回文档当前的全部片段ID"""
+        return self.doc_store.get_chunk_ids(file_paths)
+
+    def remove_documents(self, file_paths: List[str], save: bool = True) -> int:
+        """按文件路径删除文档的全部片段及其向量，返回删除的文档数量"""
+        removed_docs = [path for path in file_paths if path in self.documents]
+        if not removed_docs:
+            return 0
+
+        removed_ids = self.doc_store.remove_documents(removed_docs)
+        self.index = remove_ids(self.index,
+                                np.sort(removed_ids),
+                                np.array(self.chunk_ids, dtype='int64'))
+        configure_search(self.index, self.nprobe, self.ef_search)
+
+        self.bm25_index.remove_documents(removed_ids.tolist())
+        self._selections = {}
+
+        if save:
+            self._save_index()
+        return len(removed_docs)
 
     def hybrid_search(self, query: str, top_k: int = 5,
                       content_filter: str = None) -> List[Tuple[int, float, Dict[str, Any]]]:
-        """混合搜索：BM25 + 向量相似度"""
+        """混合搜索：BM25 + 向量相似度，返回最相关的片段"""
+        return self.batch_hybrid_search([query], top_k, content_filter)[0]
 
-        # BM25搜索
-        tokenized_query = self._tokenize(query)
-        bm25_scores = self.bm25_index.get_scores(tokenized_query)
-        bm25_indices = np.argsort(bm25_scores)[::-1][:top_k * 2]
+    def batch_hybrid_search(self, queries: List[str], top_k: int = 5,
+                            content_filter: Any = None) -> List[List[Tuple[int, float, Dict[str, Any]]]]:
+        """批量混合搜索：查询向量一次编码，FAISS 对整个查询矩阵一次检索
 
-        # 向量搜索
-        query_embedding = self.model.encode([query], convert_to_numpy=True)
-        vector_scores, vector_indices = self.index.search(
-            query_embedding.astype('float32'), top_k * 2
-        )
-        vector_scores = vector_scores[0]
-        vector_indices = vector_indices[0]
+        content_filter 为内容标签（"表格"/"公式"）或筛选字典（见 normalize_filter），
+        在 BM25 和向量检索内部生效，筛选后的片段足够时总能返回 top_k 个结果。
+        """
+        selection = self._select(content_filter)
+        if not len(self.doc_store) or (selection is not None and not len(selection['ids'])):
+            return [[] for _ in queries]
+
+        candidate_k = max(top_k * 2, settings.FUSION_CANDIDATES)
+
+        # 向量搜索（归一化向量的内积即余弦相似度）
+        query_embeddings = self.encode_queries(queries)
+        all_vector_scores, all_vector_ids = self._vector_search(query_embeddings, candidate_k, selection)
+
+        bm25_mask = selection['bm25_mask'] if selection is not None else None
+        results = []
+        for query, vector_scores, vector_ids in zip(queries, all_vector_scores, all_vector_ids):
+            # BM25搜索（只对包含查询词的片段打分）
+            tokenized_query = self._tokenize_query(query)
+            bm25_slots, bm25_scores = self.bm25_index.top_k(tokenized_query, candidate_k, bm25_mask)
+            bm25_ids = self.bm25_index.doc_ids[bm25_slots]
 
-        # 合并结果
-        combined_scores = {}
-        for idx, score in zip(bm25_indices, bm25_scores[bm25_indices]):
-            combined_scores[idx] = combined_scores.get(idx, 0) + score * 0.3
+            valid = vector_ids >= 0
+            results.append(self._fuse_results(bm25_ids, bm25_scores, vector_ids[valid], vector_scores[valid],
+                                              top_k))
+        return results
 
-        for idx, score in zip(vector_indices, vector_scores):
-            combined_scores[idx] = combined_scores.get(idx, 0) + score * 0.7
+    def _select(self, content_filter: Any):
+        """解析筛选条件并缓存其允许的片段；无筛选时返回 None"""
+        spec = normalize_filter(content_filter)
+        if spec is None:
+            return None
+        key = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+        with self._selections_lock:
+            selection = self._selections.get(key)
+        if selection is None:
+            positions = np.flatnonzero(self.doc_store.select(spec))
+            ids = np.asarray(self.chunk_ids[positions], dtype='int64')
+            selection = {'positions': positions, 'ids': ids, 'bm25_mask': self.bm25_index.slot_mask(ids),
+                         'params': None, 'vectors': None}
+            if len(ids) > settings.FILTER_EXACT_MAX:
+                effort = min(self.index.ntotal / len(ids), settings.FILTER_MAX_EFFORT)
+                selection['params'] = filtered_search_params(self.index, ids, self.nprobe, self.ef_search,
+                                                             max(effort, 1.0))
+            elif len(ids):
+                # 精确检索的片段向量取一次后随筛选结果缓存，每个不超过 FILTER_EXACT_MAX 行
+                vectors = self.embedding_store.get_many(self.doc_store.content_keys(positions))
+                selection['vectors'] = vectors if vectors is not None else self.index.reconstruct_batch(ids)
+            with self._selections_lock:
+                while len(self._selections) >= FILTER_CACHE_SIZE:
+                    self._selections.pop(next(iter(self._selections)), None)
+                self._selections[key] = selection
+        return selection
 
-        # 排序并过滤
-        sorted_results = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
+    def _vector_search(self, query_embeddings: np.ndarray, k: int, selection=None) -> Tuple[np.ndarray, np.ndarray]:
+        """向量检索；有筛选时只在允许的片段中检索"""
+        if selection is None:
+            return self.index.search(query_embeddings, k)
+        if selection['params'] is not None:
+            return self.index.search(query_embeddings, k, params=selection['params'])
 
-        # 应用内容过滤
-        filtered_results = []
-        for idx, score in sorted_results[:top_k * 2]:
-            doc = self.documents[idx]
+        # 筛选后的片段较少：直接计算与这些片段的精确相似度
+        ids = selection['ids']
+        scores = query_embeddings @ selection['vectors'].T
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        return np.take_along_axis(top_scores, order, axis=1), ids[np.take_along_axis(top, order, axis=1)]
 
-            if content_filter:
-                if content_filter == "含表格" and "【表格】" not in doc['content']:
-                    continue
-                if content_filter == "含公式" and "【公式】" not in doc['content']:
-                    continue
+    def _fuse_results(self, bm25_ids: np.ndarray, bm25_scores: np.ndarray,
+                      vector_ids: np.ndarray, vector_scores: np.ndarray,
+                      top_k: int) -> List[Tuple[int, float, Dict[str, Any]]]:
+        """融合两路结果，读取前 top_k 个片段"""
+        sorted_results = fuse_scores(
+            [(bm25_ids, bm25_scores), (vector_ids, vector_scores)],
+            weights=[settings.BM25_WEIGHT, settings.VECTOR_WEIGHT]
+        )
+        return [(chunk_id, score, self.doc_store.get(chunk_id)) for chunk_id, score in sorted_results[:top_k]]
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """编码查询，形状为 (1, dim)；相同或仅标点空白不同的查询直接复用缓存向量"""
+        embedding = self.query_cache.get(query)
+        if embedding is None:
+            embedding = self._encode([query])
+            self.query_cache.put(query, embedding)
+        return embedding
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """批量编码查询，形状为 (n, dim)；缓存未命中的查询合并为一次 model.encode 调用"""
+        embeddings = [self.query_cache.get(query) for query in queries]
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+        if missing:
+            encoded = {}
+            for query, embedding in zip(missing, self._encode(missing)):
+                encoded[query] = embedding[None, :]
+                self.query_cache.put(query, encoded[query])
+            embeddings = [embedding if embedding is not None else encoded[query]
+                          for query, embedding in zip(queries, embeddings)]
+        return np.ascontiguousarray(np.vstack(embeddings), dtype='float32')
 
-            filtered_results.append((idx, score, doc))
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """编码并L2归一化，使内积等于余弦相似度"""
+        with ENCODE_LOCK:
+            embeddings = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return np.ascontiguousarray(embeddings, dtype='float32')
 
-        return filtered_results[:top_k]
+    def _chunk_text(self, chunk: Dict[str, Any]) -> str:
+        """组合标题和片段内容作为检索文本"""
+        return f"{chunk['title']} {chunk['content']}"
+
+    def _build_bm25(self) -> BM25Index:
+        """根据当前片段重新构建BM25索引"""
+        bm25_index = BM25Index(tokenizer=self.tokenizer.name)
+        bm25_index.add_documents(self.chunk_ids.tolist(),
+                                 [self._tokenize(self._chunk_text(chunk)) for chunk in self.doc_store.iter_chunks()])
+        return bm25_index
 
     def _tokenize(self, text: str) -> List[str]:
-        """简单的分词函数"""
-        return text.lower().split()
+        """使用配置的分词器分词"""
+        return self.tokenizer.tokenize(text)
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        """调整近似检索的查询参数：IVF 的 nprobe、HNSW 的 efSearch"""
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self._selections = {}
+        if self.index is not None:
+            configure_search(self.index, nprobe, ef_search)
+
+    def _optimize_index(self):
+        """按当前规模和配置转换向量索引类型"""
+        target = choose_index_type(self.index.ntotal)
+        current = get_index_type(self.index)
+        if target != current:
+            print(f"向量索引类型切换: {current} -> {target}（{self.index.ntotal} 个向量）")
+            # 优先使用向量库中的原始向量，避免从有损索引重建
+            vectors = self.embedding_store.get_many(self._content_keys())
+            self.index = convert_index(self.index, target, np.array(self.chunk_ids, dtype='int64'), vectors)
+            self._selections = {}
+        configure_search(self.index, self.nprobe, self.ef_search)
+
+    def _content_keys(self) -> List[bytes]:
+        return self.doc_store.content_keys()
+
+    def compact_embeddings(self) -> int:
+        """清理向量库中不再被任何片段引用的向量"""
+        return self.embedding_store.compact(self._content_keys())
+
+    def save(self):
+        """将当前索引写入磁盘"""
+        if self.index is not None:
+            self._save_index()
 
     def _save_index(self):
-        """保存索引到文件"""
+        """保存索引到文件
+
+        各文件先写临时文件再原子替换，index_meta.json 最后写入作为提交标记；
+        其他进程在写入过程中加载时，load_index 发现不一致会拒绝加载。
+        """
         if not os.path.exists(settings.FAISS_INDEX_PATH):
             os.makedirs(settings.FAISS_INDEX_PATH)
 
         # 保存FAISS索引
-        faiss.write_index(self.index, os.path.join(settings.FAISS_INDEX_PATH, "faiss.index"))
+        self._optimize_index()
+        index_path = os.path.join(settings.FAISS_INDEX_PATH, "faiss.index")
+        faiss.write_index(self.index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
 
-        # 保存文档数据和映射
-        with open(os.path.join(settings.FAISS_INDEX_PATH, "documents.pkl"), 'wb') as f:
-            pickle.dump({
-                'documents': self.documents,
-                'doc_id_to_index': self.doc_id_to_index
-            }, f)
+        # 保存BM25倒排表
+        self.bm25_index.save(os.path.join(settings.FAISS_INDEX_PATH, "bm25"))
 
-    def load_index(self):
-        """从文件加载索引"""
+        # 保存片段和父文档数据
+        self.doc_store.save(os.path.join(settings.FAISS_INDEX_PATH, "docstore"), {
+            'format_version': INDEX_FORMAT_VERSION,
+            'next_id': self.next_id,
+            'index_epoch': self.index_epoch
+        })
+        legacy_path = os.path.join(settings.FAISS_INDEX_PATH, "documents.pkl")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+        write_index_meta({
+            'format_version': INDEX_FORMAT_VERSION,
+            'index_epoch': self.index_epoch,
+            'chunks': len(self.doc_store),
+            'documents': len(self.documents)
+        })
+
+    def load_index(self, persist: bool = True):
+        """从文件加载索引
+
+        persist 为 False 时（服务热加载）只读取索引目录：BM25 倒排表缺失或不一致
+        时只在内存中重建，写入留给入库流程，避免与正在进行的入库同时写目录。
+        """
         try:
             # 加载FAISS索引
-            self.index = faiss.read_index(os.path.join(settings.FAISS_INDEX_PATH, "faiss.index"))
+            index = faiss.read_index(os.path.join(settings.FAISS_INDEX_PATH, "faiss.index"))
+
+            # 加载片段数据（内存映射）
+            store_dir = os.path.join(settings.FAISS_INDEX_PATH, "docstore")
+            if DocumentStore.exists(store_dir):
+                doc_store = DocumentStore.load(store_dir)
+            else:
+                doc_store = self._migrate_legacy_documents(store_dir)
+            meta = doc_store.meta
+
+            if meta.get('format_version', 1) < INDEX_FORMAT_VERSION:
+                # 旧版索引为整篇文档向量或未归一化向量，无法直接转换
+                print("索引格式已过期，请运行 python main.py --process 重建索引")
+                return False
 
-            # 加载文档数据
-            with open(os.path.join(settings.FAISS_INDEX_PATH, "documents.pkl"), 'rb') as f:
-                data = pickle.load(f)
-                self.documents = data['documents']
-                self.doc_id_to_index = data['doc_id_to_index']
+            # 入库正在写入时各文件可能分属不同版本
+            if index.ntotal != len(doc_store):
+                raise ValueError(f"向量数（{index.ntotal}）与片段数（{len(doc_store)}）不一致，可能正在入库")
+            committed = read_index_meta()
+            if committed is not None and (committed.get('index_epoch') != meta.get('index_epoch')
+                                          or committed.get('chunks') != len(doc_store)):
+                raise ValueError("索引文件与 index_meta.json 不一致，可能正在入库")
 
-            # 重新创建BM25索引
-            texts = [f"{doc['title']} {doc['content']}" for doc in self.documents]
-            tokenized_texts = [self._tokenize(text) for text in texts]
-            self.bm25_index = BM25Okapi(tokenized_texts)
+            self.index = index
+            configure_search(self.index, self.nprobe, self.ef_search)
+            self.doc_store = doc_store
+            self._selections = {}
+            self.next_id = meta['next_id']
+            self.index_epoch = meta.get('index_epoch', 'legacy')
+
+            # 加载BM25倒排表，旧版索引没有时重建一次并保存
+            bm25_dir = os.path.join(settings.FAISS_INDEX_PATH, "bm25")
+            try:
+                self.bm25_index = BM25Index.load(bm25_dir, tokenizer=self.tokenizer.name)
+                if len(self.bm25_index) != len(self.chunk_ids):
+                    raise ValueError("片段数量与向量索引不一致")
+            except (OSError, ValueError) as e:
+                print(f"BM25索引不可用（{e}），重新构建")
+                self.bm25_index = self._build_bm25()
+                if persist:
+                    self.bm25_index.save(bm25_dir)
 
             print("索引加载成功")
             return True
         except Exception as e:
             print(f"索引加载失败: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def _migrate_legacy_documents(self, store_dir: str) -> DocumentStore:
+        """将旧版 documents.pkl 转换为列式存储（仅用于本机生成的旧索引）"""
+        import pickle
+
+        legacy_path = os.path.join(settings.FAISS_INDEX_PATH, "documents.pkl")
+        with open(legacy_path, 'rb') as f:
+            data = pickle.load(f)
+        meta = {
+            'format_version': data.get('format_version', 1),
+            'next_id': data['next_id'],
+            'index_epoch': data.get('index_epoch', 'legacy')
+        }
+        doc_store = DocumentStore()
+        if meta['format_version'] < INDEX_FORMAT_VERSION:
+            doc_store.meta = meta
+            return doc_store
+
+        by_path = {}
+        for chunk_id, chunk in zip(data['chunk_ids'], data['chunks']):
+            chunk['chunk_id'] = chunk_id
+            chunk.setdefault('content_hash', EmbeddingStore.content_hash(self._chunk_text(chunk)).hex())
+            by_path.setdefault(chunk['file_path'], []).append(chunk)
+        for path, doc_meta in data['documents'].items():
+            doc_store.add_document(doc_meta, by_path.get(path, []))
+        # 按片段ID排序，保证按ID二分查找
+        order = np.argsort(doc_store.chunk_ids, kind='stable')
+        doc_store.rows, doc_store.tags = doc_store.rows[order], doc_store.tags[order]
+        doc_store.save(store_dir, meta)
+        os.remove(legacy_path)
+        print(f"已将 documents.pkl 转换为列式文档存储（{len(doc_store)} 个片段）")
+        return doc_store